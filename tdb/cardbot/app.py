@@ -1,12 +1,17 @@
 import logging
+import time
 from abc import ABC
+from typing import Callable
 
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Request, Response
+from starlette.routing import Match
 from uvicorn import Config as UvicornConfig
 from uvicorn import Server
 
 from tdb.cardbot import config
 from tdb.cardbot import logger
+from tdb.cardbot import metrics
+from tdb.cardbot.profiling import Profiler
 from tdb.cardbot.routes import BaseRoutes
 
 
@@ -23,6 +28,14 @@ class BaseApp(ABC):
 
         logging.debug(f'Starting Application')
 
+        # Request latency per route, served by /metrics
+        cls.app.middleware('http')(cls._metrics_middleware)
+
+        # Profiling middleware is only added when enabled, so there is no overhead when it is off
+        Profiler.load(cls.config)
+        if Profiler.rate > 0:
+            cls.app.middleware('http')(cls._profile_middleware)
+
         cls.app.include_router(BaseRoutes.router)
 
         # Load specific api routes for application
@@ -45,6 +58,61 @@ class BaseApp(ABC):
 
         server.run()
 
+    @classmethod
+    def _route(cls, request: Request) -> str:
+        """
+        Path template of the route matching a request, so path parameters do not create a metric per value
+
+        :param request: Starlette Request
+        :return: Route path, or 'unmatched'
+        """
+        for route in cls.app.router.routes:
+            match, _ = route.matches(request.scope)
+            if match == Match.FULL:
+                return route.path
+
+        return 'unmatched'
+
+    @classmethod
+    async def _metrics_middleware(cls, request: Request, call_next: Callable) -> Response:
+        """
+        Observe the latency of every request
+
+        :param request: Starlette Request
+        :param call_next: Next ASGI handler
+        :return: Response
+        """
+        start = time.perf_counter()
+        status = 500
+
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+
+        finally:
+            metrics.REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=request.method,
+                route=cls._route(request),
+                status=status
+            )
+
+    @classmethod
+    async def _profile_middleware(cls, request: Request, call_next: Callable) -> Response:
+        """
+        Profile Config.profile_rate of requests
+
+        :param request: Starlette Request
+        :param call_next: Next ASGI handler
+        :return: Response
+        """
+        if not Profiler.sample_request():
+            return await call_next(request)
+
+        with Profiler.profile(f'request-{request.method}-{cls._route(request)}'):
+            return await call_next(request)
+
     @classmethod
     def _setup(cls):
         # Optional setup steps
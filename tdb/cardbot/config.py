@@ -1,11 +1,16 @@
 import json
 import os
 from abc import ABC
+from typing import Optional
 
 
 class BaseConfig(ABC):
     app: str
     log_level: str = 'DEBUG'
+    profile_dir: str = 'profiles'
+    profile_interval: float = 0.005
+    profile_job: Optional[str] = None
+    profile_rate: float = 0.0
     serialize_logging: bool = False
 
     @classmethod
@@ -37,6 +42,10 @@ class BaseConfig(ABC):
                     details = result
 
         cls.log_level = details.get('log_level', cls.log_level)
+        cls.profile_dir = details.get('profile_dir', cls.profile_dir)
+        cls.profile_interval = details.get('profile_interval', cls.profile_interval)
+        cls.profile_job = details.get('profile_job', cls.profile_job)
+        cls.profile_rate = details.get('profile_rate', cls.profile_rate)
         cls.serialize_logging = details.get('serialize_logging', cls.serialize_logging)
 
         cls._load(details)
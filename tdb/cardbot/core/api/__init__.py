@@ -1,21 +1,142 @@
-import datetime
+import hashlib
+import json
 import logging
+import multiprocessing
 import os
+import queue
 import re
+import threading
+import time
+import zlib
+from collections import defaultdict
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Iterator, List, Optional, Dict
 
+from sqlalchemy import BigInteger, Boolean, Integer, String
 from sqlalchemy.orm import Session
 
+from tdb.cardbot import metrics
 from tdb.cardbot.core import config
-from tdb.cardbot.core.api.mtgjson import MTGJson, Filenames
+from tdb.cardbot.core import models
+from tdb.cardbot.core.api.images import ImageDownloader, ImageHasher
+from tdb.cardbot.core.api.mtgjson import MTGJson, Filenames, IdentifierMap
 from tdb.cardbot.core.api.scryfall import Scryfall
+from tdb.cardbot.core.api.stats import JobStats
 from tdb.cardbot.core.crud.card import Card
 from tdb.cardbot.core.crud.job import Job
 from tdb.cardbot.core.database import Database
 from tdb.cardbot.core.futures import JobPool
 from tdb.cardbot.core.schemas import JobDetails, NewCard
-from tdb.cardbot.futures import Thread, ThreadPool
+from tdb.cardbot.futures import Thread, ThreadPool, queue_get, queue_put
+
+
+# Bump when the card mapping changes, so every stored digest is treated as changed
+DIGEST_VERSION = 1
+
+# Number of cards sent to a shard process at a time
+SHARD_BATCH_SIZE = 100
+
+# Config used by the shard processes, spawned processes start with a default Config
+SHARD_CONFIG = ('batch_size', 'image_path', 'queue_size', 'stats_interval', 'validate_cards')
+
+RECORDS = metrics.Counter(
+    'cardbot_ingest_records',
+    'Scryfall cards processed by Api jobs, written or skipped as unchanged',
+    ('result',)
+)
+
+# Strings pydantic reads as True for a bool field
+_TRUE_STRINGS = {'1', 'on', 't', 'true', 'y', 'yes'}
+
+
+def _to_str(value: Any) -> Optional[str]:
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def _to_bool(value: Any) -> Optional[bool]:
+    if value is None or isinstance(value, bool):
+        return value
+
+    if isinstance(value, str):
+        return value.lower() in _TRUE_STRINGS
+
+    return bool(value)
+
+
+def _to_int(value: Any) -> Optional[int]:
+    return value if value is None or isinstance(value, int) else int(value)
+
+
+def _card_columns() -> Dict[str, Optional[Callable[[Any], Any]]]:
+    """
+    Card columns written by ingestion, with the coercion of each column type (None for JSON, stored as is). The
+    hash columns belong to the image stages and are left out, as NewCard leaves them out
+
+    :return: coercion keyed by column name
+    """
+    coercions = ((String, _to_str), (Boolean, _to_bool), (BigInteger, _to_int), (Integer, _to_int))
+
+    return {
+        column.name: next((coerce for column_type, coerce in coercions if isinstance(column.type, column_type)), None)
+        for column in models.Card.__table__.columns
+        if column.name not in ('phash_32', 'phash_8')
+    }
+
+
+CARD_COLUMNS = _card_columns()
+
+
+class _ShardImages:
+    def __init__(self, image_queue: multiprocessing.Queue):
+        """
+        ImageDownloader stand-in used by shard processes; image downloads are queued for the parent's image stages
+
+        :param image_queue: Queue read by the parent
+        """
+        self.image_queue = image_queue
+
+    def put(self, card_id: str, image_url: str, image_local: str, hashed: bool) -> bool:
+        self.image_queue.put((card_id, image_url, image_local, hashed))
+        return True
+
+
+class _ShardStats(JobStats):
+    def __init__(self, results_queue: multiprocessing.Queue):
+        """
+        JobStats of a shard process. Record counts are also sent to the parent every Config.stats_interval seconds, so
+        the parent's Job.results count them while the job runs
+
+        :param results_queue: Queue read by the parent
+        """
+        super().__init__()
+
+        self.results_queue = results_queue
+
+        self._pending: Dict[str, int] = defaultdict(int)
+        self._sent_time = time.monotonic()
+
+    def add_records(self, worker: str, count: int = 1):
+        super().add_records(worker, count)
+
+        with self._lock:
+            self._pending[worker] += count
+
+            if config.Config.stats_interval <= 0 or time.monotonic() - self._sent_time < config.Config.stats_interval:
+                return
+
+        self.send_records()
+
+    def send_records(self):
+        """
+        Send the records counted since the last send to the parent
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = defaultdict(int)
+            self._sent_time = time.monotonic()
+
+        for worker, count in pending.items():
+            self.results_queue.put(('records', worker, count))
 
 
 class Api(JobPool):
@@ -26,7 +147,13 @@ class Api(JobPool):
         return f'{name}[{scryfall_id}].png'
 
     @classmethod
-    def _process_card(cls, db: Session, **card_data):
+    def _process_card(cls, **card_data) -> dict:
+        """
+        Build the Card column dict for a Scryfall card or card face
+
+        :param card_data: Scryfall card (or card face) details
+        :return: Card column dict
+        """
         png_url = None
         image_local = None
 
@@ -57,148 +184,701 @@ class Api(JobPool):
             os.remove(old_filename)
         # TODO - ................................................
 
-        card_full = NewCard(
-            **card_data,
-            object_type=card_data['object'],
-            image_url=png_url,
-            image_local=image_local
-        )
+        card_data.update(object_type=card_data['object'], image_url=png_url, image_local=image_local)
 
-        card = Card.upsert(db, card_full, commit=False)
+        if config.Config.validate_cards:
+            row = NewCard(**card_data).dict()
+        else:
+            row = cls._map_card(card_data)
 
-        if png_url:
-            card.download_image()
         # TODO - Remove this.....
-        else:
-            if card.phash_32:
-                card.phash_32 = None
+        if not png_url:
+            row['phash_32'] = None
+            row['phash_8'] = None
+
+        return row
 
     @classmethod
-    def _get_card_data(cls, scryfall_data: List[dict]):
-        try:
-            return scryfall_data.pop()
-        except IndexError:
-            return None
+    def _map_card(cls, card_data: dict) -> dict:
+        """
+        Map trusted bulk card data straight to a Card column dict, without pydantic validation. Gives the same dict as
+        NewCard(**card_data).dict(); unknown keys are dropped and missing columns are None
+
+        :param card_data: Scryfall card (or card face) details
+        :return: Card column dict
+        """
+        return {
+            name: coerce(card_data.get(name)) if coerce else card_data.get(name)
+            for name, coerce in CARD_COLUMNS.items()
+        }
 
     @classmethod
-    def _update_database_thread(cls, mtgjson_data: dict, scryfall_data: List[dict], prices: dict, job_id: str) -> dict:
+    def _write_cards(cls, db: Session, rows: List[dict], images: ImageDownloader, stats: JobStats):
         """
-        Separate thread to process shared mtgjson_data
+        Bulk upsert and commit Card rows, then queue the images that need downloading or hashing
+
+        :param db: SqlAlchemy DB Session
+        :param rows: List of Card column dicts
+        :param images: Image download stage
+        :param stats: Job stats, receiving the db_write stage time
+        """
+        with stats.stage('db_write'):
+            records = Card.upsert_many(
+                db,
+                rows,
+                returning=(
+                    models.Card.id,
+                    models.Card.image_url,
+                    models.Card.image_local,
+                    models.Card.phash_32,
+                    models.Card.phash_8
+                ),
+            )
+
+        # Committed first, so hashes written by the image stage never wait on this transaction
+        for record in records:
+            if not record.image_url:
+                continue
+
+            hashed = bool(record.phash_32) and record.phash_8 is not None
+
+            if not hashed or not os.path.exists(Path(config.Config.image_path, record.image_local)):
+                images.put(record.id, record.image_url, record.image_local, hashed)
+
+    @classmethod
+    def _digest(cls, card_data: dict, mtgjson_uuid: Optional[str], card_price_groups: dict) -> str:
+        """
+        Content digest of the normalized upstream payload for a card
+
+        :param card_data: Scryfall card dict
+        :param mtgjson_uuid: mtgjson uuid of the card
+        :param card_price_groups: mtgjson pricing of the card
+        :return: hex digest
+        """
+        payload = json.dumps(
+            [DIGEST_VERSION, card_data, mtgjson_uuid, card_price_groups],
+            sort_keys=True,
+            separators=(',', ':'),
+            default=str
+        )
+
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    @classmethod
+    def _process_card_data(cls, card_data: dict, mtgjson_data: IdentifierMap, prices: dict,
+                           digests: Dict[str, str]) -> List[dict]:
+        """
+        Process a Scryfall card and each of its faces
 
-        :param mtgjson_data: List[dict] containing complete card data by card set
-        :param scryfall_data: dict containing Scryfall Api Image URL info keyed by scryfallId and cardName
+        :param card_data: Scryfall card dict
+        :param mtgjson_data: IdentifierMap of mtgjson uuid keyed by scryfallId
         :param prices: dict containing pricing data from mtgjson
-        :return: details on how many records were processed per set
+        :param digests: Stored content digest keyed by scryfall_id
+        :return: List of Card column dicts, empty if the card is unchanged
         """
-        processed = 0
+        scryfall_id = card_data['id']
+        lang = card_data['lang']
+        card_set = card_data['set']
+
+        mtgjson_uuid = mtgjson_data.get(scryfall_id)
+
+        card_price_groups = {
+            f'{store}_{list_type}_{card_type}': card_prices
+            for store, store_vals in prices.get(mtgjson_uuid, {}).items()
+            for list_type, card_types in (store_vals or {}).items()
+            if isinstance(card_types, dict)
+            for card_type, card_prices in (card_types or {}).items()
+        }
+
+        digest = cls._digest(card_data, mtgjson_uuid, card_price_groups)
+
+        # Fast path, skip validation and writes for unchanged cards
+        if digests.get(scryfall_id) == digest:
+            return []
+
+        rows = []
+
+        card_faces = []
+        for card_face in card_data.get('card_faces', []):
+            # Found duplicate card face names in scryfall card_faces
+            name = card_face['name']
+            if name not in card_faces:
+                card_faces.append(name)
+                rows.append(cls._process_card(
+                    id=f'{scryfall_id}-{name}',
+                    scryfall_id=scryfall_id,
+                    lang=lang,
+                    set=card_set,
+                    digest=digest,
+                    **card_face
+                ))
+
+        rows.append(cls._process_card(
+            scryfall_id=scryfall_id,
+            mtgjson_uuid=mtgjson_uuid,
+            digest=digest,
+            **card_data,
+            **card_price_groups
+        ))
+
+        return rows
 
-        # use a separate db connection for each thread
+    @classmethod
+    def _read_digests(cls) -> Dict[str, str]:
+        """
+        Prefetch stored content digests, used to skip unchanged cards
+
+        :return: digest keyed by scryfall_id
+        """
         with Database.db_contextmanager() as db:
-            while scryfall_data:
-                card_data = cls._get_card_data(scryfall_data)
+            return Card.read_digests(db)
+
+    @classmethod
+    def _read_cards(cls, scryfall_file: Path, stats: JobStats) -> Iterator[dict]:
+        """
+        Stream cards from the Scryfall bulk file, timing the parse stage and reporting the bytes read
 
-                if not card_data:
+        :param scryfall_file: Path to the downloaded Scryfall all_cards file
+        :param stats: Job stats
+        :return: Iterator of Scryfall card dicts
+        """
+        cards = Scryfall.read_cards(scryfall_file, progress=stats.progress)
+
+        try:
+            while True:
+                start = time.perf_counter()
+                card_data = next(cards, None)
+                stats.add_time('parse', time.perf_counter() - start)
+
+                if card_data is None:
+                    return
+
+                yield card_data
+
+        finally:
+            cards.close()
+
+    @classmethod
+    def _read_cards_thread(cls, scryfall_file: Path, card_queue: queue.Queue, stop: threading.Event,
+                           workers: int, stats: JobStats) -> dict:
+        """
+        Separate thread to stream cards from the Scryfall bulk file into the bounded card queue
+
+        :param scryfall_file: Path to the downloaded Scryfall all_cards file
+        :param card_queue: Queue of Scryfall card dicts shared with the db workers
+        :param stop: Event set when the job is stopping
+        :param workers: Number of db workers to send an end marker to
+        :param stats: Job stats
+        :return: details on how many records were queued
+        """
+        queued = 0
+        cards = cls._read_cards(scryfall_file, stats)
+
+        try:
+            for card_data in cards:
+                if not queue_put(card_queue, card_data, stop):
                     break
 
-                scryfall_id = card_data['id']
-                lang = card_data['lang']
-                card_set = card_data['set']
-
-                card_faces = []
-                for card_face in card_data.get('card_faces', []):
-                    # Found duplicate card face names in scryfall card_faces
-                    name = card_face['name']
-                    if name not in card_faces:
-                        card_faces.append(name)
-                        cls._process_card(
-                            db,
-                            id=f'{scryfall_id}-{name}',
-                            scryfall_id=scryfall_id,
-                            lang=lang,
-                            set=card_set,
-                            **card_face
-                        )
-
-                mtgjson_uuid = mtgjson_data.get(scryfall_id)
-
-                card_price_groups = {
-                    f'{store}_{list_type}_{card_type}': card_prices
-                    for store, store_vals in prices.get(mtgjson_uuid, {}).items()
-                    for list_type, card_types in (store_vals or {}).items()
-                    if isinstance(card_types, dict)
-                    for card_type, card_prices in (card_types or {}).items()
-                }
-
-                cls._process_card(
-                    db,
-                    scryfall_id=scryfall_id,
-                    mtgjson_uuid=mtgjson_uuid,
-                    **card_data,
-                    **card_price_groups
-                )
+                queued += 1
 
-                if processed % 200:
-                    db.commit()
+        finally:
+            # Stopping early discards the partially written parsed cache
+            cards.close()
 
-                    if not Job.read_one(db, job_id).status == 'running':
+            for _ in range(workers):
+                queue_put(card_queue, None, stop)
+
+        return {'queued': queued}
+
+    @classmethod
+    def _update_database_thread(cls, mtgjson_data: IdentifierMap, card_queue: queue.Queue, stop: threading.Event,
+                                prices: dict, digests: Dict[str, str], images: ImageDownloader, job_id: str,
+                                stats: JobStats) -> dict:
+        """
+        Separate thread to process shared mtgjson_data
+
+        :param mtgjson_data: IdentifierMap of mtgjson uuid keyed by scryfallId
+        :param card_queue: Queue of Scryfall card dicts, ended by None
+        :param stop: Event set when the job is stopping
+        :param prices: dict containing pricing data from mtgjson
+        :param digests: Stored content digest keyed by scryfall_id
+        :param images: Image download stage
+        :param job_id: Api Job id, checked every 200 records for a stop request
+        :param stats: Job stats
+        :return: details on how many records were processed, skipped as unchanged, and written
+        """
+        worker = threading.current_thread().name
+
+        processed = 0
+        skipped = 0
+        written = 0
+        rows = []
+
+        try:
+            # use a separate db connection for each thread
+            with Database.db_contextmanager() as db:
+                while True:
+                    card_data = queue_get(card_queue, stop)
+
+                    if not card_data:
                         break
 
-                logging.debug(f'Api Db Update - Remaining {len(scryfall_data)}')
+                    with stats.stage('validate'):
+                        card_rows = cls._process_card_data(card_data, mtgjson_data, prices, digests)
+
+                    processed += 1
+                    stats.add_records(worker)
 
-            db.commit()
+                    if card_rows:
+                        rows += card_rows
+                        written += 1
+                        RECORDS.inc(result='written')
+                    else:
+                        skipped += 1
+                        RECORDS.inc(result='skipped')
 
-        return {'processed': processed}
+                    if len(rows) >= config.Config.batch_size:
+                        cls._write_cards(db, rows, images, stats)
+                        rows = []
+
+                    if not processed % 200:
+                        db.commit()
+
+                        if not Job.read_one(db, job_id).status == 'running':
+                            stop.set()
+                            break
+
+                    logging.debug(f'Api Db Update - Queued {card_queue.qsize()}')
+
+                if rows:
+                    cls._write_cards(db, rows, images, stats)
+
+                db.commit()
+
+        except BaseException:
+            # Release the reader and the other workers
+            stop.set()
+            raise
+
+        return {'processed': processed, 'skipped': skipped, 'written': written}
 
     @classmethod
-    def _run(cls, details: JobDetails):
+    def _close_images(cls, images: ImageDownloader, hasher: ImageHasher) -> dict:
         """
-        Download and process data from external API sources (MTGJson, Scryfall)
+        Finish queued image downloads, then hashing, after the db workers are done
 
-        :param details: Job details
+        :param images: Image download stage
+        :param hasher: Image hashing stage
+        :return: details of both stages
         """
-        logging.debug(f'Starting Api update_data: {details.job_id}')
+        try:
+            image_results = images.close()
+        finally:
+            hash_results = hasher.close()
 
-        cls.last_job_id = details.job_id
+        return {'images': image_results, 'hashes': hash_results}
 
-        # Download data from Scryfall and MTGJson APIs (threaded)
-        threads: List[Thread] = [
-            Thread(Scryfall.download_data, results_id='scryfall'),
-            Thread(MTGJson.download_card_identifiers, results_id='mtgjson'),
-            Thread(MTGJson.download_prices, results_id='prices')
-        ]
-        results = ThreadPool.run(threads, thread_prefix='ApiSink')
+    @classmethod
+    def _ingest_threads(cls, scryfall_file: Path, mtgjson_data: IdentifierMap, prices: dict, digests: Dict[str, str],
+                        job_id: str, stats: JobStats) -> dict:
+        """
+        Ingest the Scryfall cards with Config.max_threads db worker threads
 
-        # Separate results
-        scryfall_data = results.pop('scryfall')
-        mtgjson_data = results.pop('mtgjson')
-        prices = results.pop('prices')
+        :param scryfall_file: Path to the downloaded Scryfall all_cards file
+        :param mtgjson_data: IdentifierMap of mtgjson uuid keyed by scryfallId
+        :param prices: dict containing pricing data from mtgjson
+        :param digests: Stored content digest keyed by scryfall_id
+        :param job_id: Api Job id
+        :param stats: Job stats
+        :return: details of the reader, each worker and the image stages
+        """
+        # Scryfall cards are streamed from the bulk file through a bounded queue, so memory use does not
+        # depend on the bulk file size
+        card_queue = queue.Queue(maxsize=config.Config.queue_size)
+        stop = threading.Event()
+
+        # Images are downloaded and hashed in their own stages, fed by the db workers
+        hasher = ImageHasher(stop, stats=stats)
+        images = ImageDownloader(stop, hasher, stats=stats)
 
         # Start a new ThreadPool to process the download data from external api
         threads: List[Thread] = [
+            Thread(
+                cls._read_cards_thread,
+                results_id='reader',
+                scryfall_file=scryfall_file,
+                card_queue=card_queue,
+                stop=stop,
+                workers=config.Config.max_threads,
+                stats=stats
+            )
+        ]
+        threads += [
             Thread(
                 cls._update_database_thread,
                 mtgjson_data=mtgjson_data,
-                scryfall_data=scryfall_data,
+                card_queue=card_queue,
+                stop=stop,
                 prices=prices,
-                job_id=details.job_id
+                digests=digests,
+                images=images,
+                job_id=job_id,
+                stats=stats
             )
             for _ in range(config.Config.max_threads)
         ]
-        results = ThreadPool.run(threads, thread_prefix='GetCard')
 
-        with Database.db_contextmanager() as db:
-            # Refresh details
-            details = Job.read_one(db, details.job_id)
+        try:
+            results = ThreadPool.run(threads, thread_prefix='GetCard')
+        finally:
+            image_results = cls._close_images(images, hasher)
+
+        results.update(image_results)
+
+        return results
+
+    @classmethod
+    def _dispatch_cards_thread(cls, scryfall_file: Path, card_queues: List[multiprocessing.Queue],
+                               processes: List[multiprocessing.Process], stop: threading.Event,
+                               stats: JobStats) -> dict:
+        """
+        Separate thread to stream cards from the Scryfall bulk file to the shard processes. Cards are sharded by set,
+        so all printings of a set are written by the same process, and sent in batches to limit pickling overhead
+
+        :param scryfall_file: Path to the downloaded Scryfall all_cards file
+        :param card_queues: Bounded queue of card batches per shard process
+        :param processes: Shard processes, a shard that exited stops the job instead of blocking on its full queue
+        :param stop: Event set when the job is stopping
+        :param stats: Job stats
+        :return: details on how many records and sets were sent to each shard
+        """
+        shards = len(card_queues)
+        batches = [[] for _ in range(shards)]
+        queued = [0] * shards
+        sets = [set() for _ in range(shards)]
+
+        cards = cls._read_cards(scryfall_file, stats)
+
+        try:
+            for card_data in cards:
+                shard = zlib.crc32(card_data['set'].encode()) % shards
+
+                batches[shard].append(card_data)
+                sets[shard].add(card_data['set'])
+                queued[shard] += 1
+
+                if len(batches[shard]) >= SHARD_BATCH_SIZE:
+                    if not queue_put(card_queues[shard], batches[shard], stop, processes[shard].is_alive):
+                        if not stop.is_set():
+                            logging.error(f'Api shard {shard} exited, stopping')
+                            stop.set()
+
+                        break
+
+                    batches[shard] = []
+
+            else:
+                for shard in range(shards):
+                    if batches[shard]:
+                        queue_put(card_queues[shard], batches[shard], stop, processes[shard].is_alive)
+
+        finally:
+            cards.close()
+
+            for card_queue, process in zip(card_queues, processes):
+                queue_put(card_queue, None, stop, process.is_alive)
 
-            details.results = results
+        return {
+            str(shard): {'queued': queued[shard], 'sets': len(sets[shard])}
+            for shard in range(shards)
+        }
 
-            if details.status == 'running':
-                details.status = 'complete'
+    @classmethod
+    def _unbatch_cards_thread(cls, batch_queue: multiprocessing.Queue, card_queue: queue.Queue, stop: threading.Event):
+        """
+        Shard process thread, feeding the card batches received from the dispatcher to the db worker one at a time
+
+        :param batch_queue: Queue of card batches from the dispatcher, ended by None
+        :param card_queue: Queue of Scryfall card dicts read by the db worker, ended by None
+        :param stop: Event set when the job is stopping
+        """
+        try:
+            while True:
+                batch = queue_get(batch_queue, stop)
+                if not batch:
+                    break
+
+                for card_data in batch:
+                    if not queue_put(card_queue, card_data, stop):
+                        return
 
-            details.end_time = datetime.datetime.now()
+        finally:
+            queue_put(card_queue, None, stop)
 
-            db.commit()
+    @classmethod
+    def _shard_process(cls, shard: int, batch_queue: multiprocessing.Queue, image_queue: multiprocessing.Queue,
+                       results_queue: multiprocessing.Queue, stop: threading.Event, mtgjson_data: IdentifierMap,
+                       prices: dict, digests: Dict[str, str], job_id: str, settings: dict):
+        """
+        Shard worker process. Runs a db worker on its own Database engine, over the cards of its sets. Spawned, not
+        forked: the parent has running threads (event loop, request threads, JobStats writer) whose locks a fork
+        could copy while held. mtgjson_data, prices and digests are pickled to each shard
+
+        :param shard: Shard number
+        :param batch_queue: Queue of card batches from the dispatcher, ended by None
+        :param image_queue: Queue of image downloads for the parent's image stages, ended by None
+        :param results_queue: Queue receiving ('records', worker, count) while the shard runs, then
+                              ('results', shard, details) when it is done
+        :param stop: Event set when the job is stopping
+        :param mtgjson_data: IdentifierMap of mtgjson uuid keyed by scryfallId
+        :param prices: dict containing pricing data from mtgjson
+        :param digests: Stored content digest keyed by scryfall_id
+        :param job_id: Api Job id
+        :param settings: SHARD_CONFIG values of the parent's Config
+        """
+        for name, value in settings.items():
+            setattr(config.Config, name, value)
 
-            logging.debug(f'Completed Api update_data: {details.job_id}')
+        # Records and stage times of the shard are returned with its results, records are also sent as counted
+        threading.current_thread().name = f'ApiShard-{shard}'
+        stats = _ShardStats(results_queue)
 
-        cls._lock.release()
+        card_queue = queue.Queue(maxsize=config.Config.queue_size)
+        results = {}
+
+        try:
+            feeder = threading.Thread(target=cls._unbatch_cards_thread, args=(batch_queue, card_queue, stop))
+            feeder.start()
+
+            try:
+                results = cls._update_database_thread(
+                    mtgjson_data=mtgjson_data,
+                    card_queue=card_queue,
+                    stop=stop,
+                    prices=prices,
+                    digests=digests,
+                    images=_ShardImages(image_queue),
+                    job_id=job_id,
+                    stats=stats
+                )
+            finally:
+                feeder.join()
+
+        except BaseException as e:
+            logging.exception(f'Api shard {shard} failed')
+            results['error'] = repr(e)
+
+        finally:
+            stats.send_records()
+            results['stats'] = stats.snapshot()
+            results_queue.put(('results', shard, results))
+            image_queue.put(None)
+
+    @classmethod
+    def _forward_images_thread(cls, image_queue: multiprocessing.Queue, images: ImageDownloader,
+                               processes: List[multiprocessing.Process]) -> dict:
+        """
+        Separate thread to pass image downloads queued by the shard processes to the image download stage
+
+        :param image_queue: Queue of image downloads, ended by one None per shard process
+        :param images: Image download stage
+        :param processes: Shard processes, used to stop waiting if one exits without ending its queue
+        :return: details on how many images were forwarded
+        """
+        forwarded = 0
+        running = len(processes)
+
+        while running:
+            try:
+                item = image_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break
+                continue
+
+            if item is None:
+                running -= 1
+            elif images.put(*item):
+                forwarded += 1
+
+        return {'forwarded': forwarded}
+
+    @classmethod
+    def _collect_results_thread(cls, results_queue: multiprocessing.Queue, processes: List[multiprocessing.Process],
+                                stats: JobStats) -> dict:
+        """
+        Separate thread to add the record counts sent by the shard processes to the job stats, until every shard
+        sent its results. Read while the shards run, a process does not exit until its queued items are read
+
+        :param results_queue: Queue of ('records', worker, count) and ('results', shard, details)
+        :param processes: Shard processes, used to stop waiting if one exits without sending its results
+        :param stats: Job stats of the parent
+        :return: details of each shard keyed by shard number
+        """
+        shard_results = {}
+
+        while len(shard_results) < len(processes):
+            try:
+                kind, key, value = results_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break
+                continue
+
+            if kind == 'records':
+                stats.add_records(key, value)
+            else:
+                shard_results[str(key)] = value
+
+        return shard_results
+
+    @classmethod
+    def _ingest_processes(cls, scryfall_file: Path, mtgjson_data: IdentifierMap, prices: dict,
+                          digests: Dict[str, str], job_id: str, stats: JobStats) -> dict:
+        """
+        Ingest the Scryfall cards with Config.ingest_processes shard processes, sharded by set. Pydantic validation
+        and row building are pure Python, so processes scale past the single core the GIL allows threads
+
+        :param scryfall_file: Path to the downloaded Scryfall all_cards file
+        :param mtgjson_data: IdentifierMap of mtgjson uuid keyed by scryfallId
+        :param prices: dict containing pricing data from mtgjson
+        :param digests: Stored content digest keyed by scryfall_id
+        :param job_id: Api Job id
+        :param stats: Job stats of the parent; shards send their record counts while they run, and return their own
+                      stats with their results
+        :return: details of the reader, each shard and the image stages
+        """
+        context = multiprocessing.get_context('spawn')
+        shards = config.Config.ingest_processes
+
+        stop = context.Event()
+
+        batch_size = max(1, config.Config.queue_size // SHARD_BATCH_SIZE)
+        batch_queues = [context.Queue(maxsize=batch_size) for _ in range(shards)]
+        image_queue = context.Queue()
+        results_queue = context.Queue()
+
+        processes = [
+            context.Process(
+                target=cls._shard_process,
+                name=f'ApiShard-{shard}',
+                kwargs=dict(
+                    shard=shard,
+                    batch_queue=batch_queues[shard],
+                    image_queue=image_queue,
+                    results_queue=results_queue,
+                    stop=stop,
+                    mtgjson_data=mtgjson_data,
+                    prices=prices,
+                    digests=digests,
+                    job_id=job_id,
+                    settings={name: getattr(config.Config, name) for name in SHARD_CONFIG}
+                )
+            )
+            for shard in range(shards)
+        ]
+
+        for process in processes:
+            process.start()
+
+        # Images are downloaded and hashed in the parent, fed by the shard processes
+        hasher = ImageHasher(stop, stats=stats)
+        images = ImageDownloader(stop, hasher, stats=stats)
+
+        shard_results = {}
+
+        try:
+            threads: List[Thread] = [
+                Thread(
+                    cls._dispatch_cards_thread,
+                    results_id='reader',
+                    scryfall_file=scryfall_file,
+                    card_queues=batch_queues,
+                    processes=processes,
+                    stop=stop,
+                    stats=stats
+                ),
+                Thread(
+                    cls._forward_images_thread,
+                    results_id='forwarder',
+                    image_queue=image_queue,
+                    images=images,
+                    processes=processes
+                ),
+                Thread(
+                    cls._collect_results_thread,
+                    results_id='collector',
+                    results_queue=results_queue,
+                    processes=processes,
+                    stats=stats
+                )
+            ]
+            results = ThreadPool.run(threads, thread_prefix='ApiShard')
+            shard_results = results.pop('collector')
+
+        finally:
+            if len(shard_results) < shards:
+                stop.set()
+
+            for process in processes:
+                process.join()
+
+            image_results = cls._close_images(images, hasher)
+
+        # Merge the dispatcher counts (queued, sets) into each shard's db worker counts
+        for shard, details in results.pop('reader').items():
+            shard_results.setdefault(shard, {'error': 'exited without results'}).update(details)
+
+        # Metrics counted in the shard processes are not seen by /metrics of this process
+        for details in shard_results.values():
+            RECORDS.inc(details.get('written', 0), result='written')
+            RECORDS.inc(details.get('skipped', 0), result='skipped')
+
+        results['shards'] = shard_results
+        results.update(image_results)
+
+        return results
+
+    @classmethod
+    def _run(cls, details: JobDetails):
+        """
+        Download and process data from external API sources (MTGJson, Scryfall)
+
+        :param details: Job details
+        """
+        logging.debug(f'Starting Api update_data: {details.job_id}')
+
+        cls.last_job_id = details.job_id
+
+        # Throughput, stage times and ETA are written to Job.results while the job runs
+        stats = JobStats(details.job_id).start()
+
+        try:
+            # Download data from Scryfall and MTGJson APIs and prefetch stored digests (threaded)
+            threads: List[Thread] = [
+                Thread(Scryfall.download_data, results_id='scryfall'),
+                Thread(MTGJson.download_card_identifiers, results_id='mtgjson'),
+                Thread(MTGJson.download_prices, results_id='prices'),
+                Thread(cls._read_digests, results_id='digests')
+            ]
+            with stats.stage('download'):
+                results = ThreadPool.run(threads, thread_prefix='ApiSink')
+
+            # Separate results
+            scryfall_file = results.pop('scryfall')
+            mtgjson_data = results.pop('mtgjson')
+            prices = results.pop('prices')
+            digests = results.pop('digests')
+
+            if config.Config.ingest_processes > 1:
+                results = cls._ingest_processes(scryfall_file, mtgjson_data, prices, digests, details.job_id, stats)
+            else:
+                results = cls._ingest_threads(scryfall_file, mtgjson_data, prices, digests, details.job_id, stats)
+
+        finally:
+            # Stop the periodic writes before the final results are written
+            stats_results = stats.close()
+
+        results['stats'] = stats_results
+
+        cls._complete(details, results)
@@ -0,0 +1,345 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from tdb.cardbot import metrics
+from tdb.cardbot.core import config
+from tdb.cardbot.core import models
+from tdb.cardbot.core.api.stats import JobStats
+from tdb.cardbot.core.crud.card import Card
+from tdb.cardbot.core.crud.job import Job
+from tdb.cardbot.core.database import Database
+from tdb.cardbot.core.futures import JobPool
+from tdb.cardbot.core.image import hash_image
+from tdb.cardbot.core.schemas import JobDetails
+from tdb.cardbot.futures import queue_get, queue_put
+
+
+IMAGES = metrics.Counter('cardbot_images', 'Card image downloads by result (downloaded or failed)', ('result',))
+HASHES = metrics.Counter('cardbot_image_hashes', 'Card images hashed by result (hashed or failed)', ('result',))
+
+
+def _init_hash_process(hash_pixels_height: int, fast_decode: bool = False):
+    """
+    Hash process initializer; spawned processes start with a default Config
+
+    :param hash_pixels_height: Config.hash_pixels_height of the parent process
+    :param fast_decode: Config.fast_decode of the parent process
+    """
+    config.Config.hash_pixels_height = hash_pixels_height
+    config.Config.fast_decode = fast_decode
+
+
+def _hash_image_timed(path: str) -> Tuple[Optional[str], Optional[int], float]:
+    """
+    hash_image, with the seconds it took in the hash process
+
+    :param path: Image path
+    :return: (phash, phash_8, seconds)
+    """
+    start = time.perf_counter()
+    phash, phash_8 = hash_image(path)
+
+    return phash, phash_8, time.perf_counter() - start
+
+
+class ImageHasher:
+    def __init__(self, stop: threading.Event, *, processes: int = None, stats: JobStats = None):
+        """
+        Image hashing stage. phash is CPU bound, so images are hashed in a ProcessPoolExecutor instead of GIL bound
+        threads. Completed hashes are stored in batches by a writer thread.
+
+        :param stop: Event set when the job is stopping
+        :param processes: Number of hash processes, defaults to Config.hash_processes
+        :param stats: Job stats, receiving the hash and db_write stage times
+        """
+        self.stop = stop
+        self.processes = processes or config.Config.hash_processes
+        self.stats = stats or JobStats()
+
+        # Bound the submitted work, so producers wait for the processes instead of queueing every image
+        self._pending = threading.BoundedSemaphore(self.processes * 4)
+
+        # Spawned, not forked; the parent has running threads and open DB connections
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_hash_process,
+            initargs=(config.Config.hash_pixels_height, config.Config.fast_decode)
+        )
+
+        self.completed = queue.Queue()
+
+        self._writer = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='ImageHashWriter')
+        self._writer_future = self._writer.submit(self._write_hashes_thread)
+
+    def submit(self, card_id: str, image_local: str) -> bool:
+        """
+        Hash an image in the process pool, waiting while the pool is saturated
+
+        :param card_id: Card id
+        :param image_local: Image path relative to Config.image_path
+        :return: False if the job stopped before the image was submitted
+        """
+        while not self._pending.acquire(timeout=1):
+            if self.stop.is_set():
+                return False
+
+        try:
+            future = self._executor.submit(_hash_image_timed, str(Path(config.Config.image_path, image_local)))
+        except BaseException:
+            self._pending.release()
+            raise
+
+        future.add_done_callback(lambda done: self._hashed(card_id, done))
+
+        return True
+
+    def _hashed(self, card_id: str, future: concurrent.futures.Future):
+        """
+        Report a finished hash to the writer thread
+
+        :param card_id: Card id
+        :param future: Finished hash_image future
+        """
+        self._pending.release()
+
+        try:
+            phash, phash_8, seconds = future.result()
+            self.stats.add_time('hash', seconds)
+        except BaseException as e:
+            logging.warning(f'Unable to hash image of {card_id}: {e}')
+            phash, phash_8 = None, None
+
+        self.completed.put((card_id, phash, phash_8))
+
+    def _write_hashes_thread(self) -> dict:
+        """
+        Store completed hashes in batches of Config.batch_size, flushing early when hashing goes quiet
+
+        :return: details on how many images were hashed, failed and written
+        """
+        hashed = 0
+        failed = 0
+        written = 0
+        hashes = {}
+
+        with Database.db_contextmanager() as db:
+            while True:
+                try:
+                    item = self.completed.get(timeout=1)
+                except queue.Empty:
+                    item = ()
+
+                if item:
+                    card_id, phash, phash_8 = item
+
+                    if phash:
+                        hashes[card_id] = (phash, phash_8)
+                        hashed += 1
+                        HASHES.inc(result='hashed')
+                    else:
+                        failed += 1
+                        HASHES.inc(result='failed')
+
+                if hashes and (not item or len(hashes) >= config.Config.batch_size):
+                    with self.stats.stage('db_write'):
+                        Card.update_hashes(db, hashes)
+                    written += len(hashes)
+                    hashes = {}
+
+                if item is None:
+                    break
+
+        return {'hashed': hashed, 'failed': failed, 'written': written}
+
+    def close(self) -> dict:
+        """
+        Wait for submitted images to finish, then stop the processes and the writer thread
+
+        :return: details on how many images were hashed, failed and written
+        """
+        try:
+            self._executor.shutdown(wait=True, cancel_futures=self.stop.is_set())
+
+        finally:
+            # Hashing is done, so the writer can drain and stop
+            self.completed.put(None)
+
+        try:
+            results = self._writer_future.result()
+
+        finally:
+            self._writer.shutdown(wait=False)
+
+        logging.debug(f'Image hashing complete: {results}')
+
+        return results
+
+
+class ImageDownloader:
+    def __init__(self, stop: threading.Event, hasher: ImageHasher, *, workers: int = None, queue_size: int = None,
+                 stats: JobStats = None):
+        """
+        Image download stage. Card images are fetched by a bounded pool of download threads sharing one keep-alive
+        HTTP session, then passed to the hashing stage. DB workers only queue
+        (card id, image_url, image_local, hashed), so DB writes and downloads overlap.
+
+        :param stop: Event set when the job is stopping
+        :param hasher: Image hashing stage
+        :param workers: Number of download threads, defaults to Config.image_threads
+        :param queue_size: Size of the bounded download queue, defaults to Config.queue_size
+        :param stats: Job stats, receiving the images stage time
+        """
+        self.stop = stop
+        self.hasher = hasher
+        self.workers = workers or config.Config.image_threads
+        self.stats = stats or JobStats()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.workers,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.downloads = queue.Queue(maxsize=queue_size or config.Config.queue_size)
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix='ImageDownload')
+        self._futures = [self._executor.submit(self._download_thread) for _ in range(self.workers)]
+
+    def put(self, card_id: str, image_url: str, image_local: str, hashed: bool) -> bool:
+        """
+        Queue a card image, waiting while the queue is full
+
+        :param card_id: Card id
+        :param image_url: Scryfall image url
+        :param image_local: Image path relative to Config.image_path
+        :param hashed: The stored hashes are complete, only hash the image again if it is downloaded
+        :return: False if the job stopped before the image was queued
+        """
+        return queue_put(self.downloads, (card_id, image_url, image_local, hashed), self.stop)
+
+    def _download_thread(self) -> dict:
+        """
+        Download queued images (if missing) and submit new or unhashed images to the hashing stage
+
+        :return: details on how many images were downloaded and failed
+        """
+        downloaded = 0
+        failed = 0
+
+        while True:
+            item: Optional[Tuple[str, str, str, bool]] = queue_get(self.downloads, self.stop)
+            if not item:
+                break
+
+            card_id, image_url, image_local, hashed = item
+
+            try:
+                with self.stats.stage('images'):
+                    new_image = models.Card.download_image_file(image_url, image_local, session=self.session)
+            except Exception as e:
+                logging.warning(f'Unable to download image "{image_url}": {e}')
+                failed += 1
+                IMAGES.inc(result='failed')
+                continue
+
+            if new_image:
+                downloaded += 1
+                IMAGES.inc(result='downloaded')
+
+            if new_image or not hashed:
+                if not self.hasher.submit(card_id, image_local):
+                    break
+
+        return {'downloaded': downloaded, 'failed': failed}
+
+    def close(self) -> dict:
+        """
+        Wait for queued images to finish downloading, then stop the download threads
+
+        :return: details on how many images were downloaded and failed
+        """
+        try:
+            for _ in range(self.workers):
+                queue_put(self.downloads, None, self.stop)
+
+            results = {'downloaded': 0, 'failed': 0}
+            for future in self._futures:
+                for key, value in future.result().items():
+                    results[key] += value
+
+        finally:
+            self._executor.shutdown(wait=False)
+            self.session.close()
+
+        logging.debug(f'Image downloads complete: {results}')
+
+        return results
+
+
+class Rehash(JobPool):
+    # Runs independently of Api jobs
+    _lock = threading.Lock()
+
+    @classmethod
+    def _run(cls, details: JobDetails):
+        """
+        Rebuild the phash of every downloaded Card image in the hashing stage
+
+        :param details: Job details
+        """
+        logging.debug(f'Starting Rehash: {details.job_id}')
+
+        cls.last_job_id = details.job_id
+
+        stop = threading.Event()
+        stats = JobStats(details.job_id).start()
+        hasher = ImageHasher(stop, stats=stats)
+
+        submitted = 0
+        missing = 0
+
+        try:
+            with Database.db_contextmanager() as db:
+                for batch in Card.read_image_batches(db, config.Config.batch_size):
+                    for card_id, image_local in batch:
+                        if not Path(config.Config.image_path, image_local).exists():
+                            missing += 1
+                            continue
+
+                        if not hasher.submit(card_id, image_local):
+                            break
+
+                        submitted += 1
+                        stats.add_records('Rehash')
+
+                    # Check for a stop request once per batch, with a separate session as db is streaming
+                    with Database.db_contextmanager() as job_db:
+                        if not Job.read_one(job_db, details.job_id).status == 'running':
+                            stop.set()
+
+                    if stop.is_set():
+                        break
+
+        finally:
+            try:
+                results = hasher.close()
+            finally:
+                stats_results = stats.close()
+
+        results.update(submitted=submitted, missing=missing, stats=stats_results)
+
+        cls._complete(details, results)
@@ -1,6 +1,13 @@
 import logging
+import lzma
+import uuid
 from enum import Enum
+from pathlib import Path
+from typing import Iterable, Tuple, Optional, Iterator, TextIO
 
+import numpy
+
+from tdb.cardbot.core import config
 from tdb.cardbot.core import utils
 
 MTGJSON_API_URL = 'https://mtgjson.com/api/v5/'
@@ -9,6 +16,66 @@ MTGJSON_API_URL = 'https://mtgjson.com/api/v5/'
 class Filenames(Enum):
     ALL_PRINTINGS = 'AllPrintings.json.xz'
     ALL_PRICES = 'AllPrices.json.xz'
+    META = 'Meta.json'
+
+
+class IdentifierMap:
+    keys: numpy.ndarray
+    values: numpy.ndarray
+
+    def __init__(self, pairs: Iterable[Tuple[str, str]]):
+        """
+        Compact scryfallId -> mtgjson uuid map. Both ids are stored as 16 byte UUIDs in sorted fixed-width arrays
+        and looked up with a binary search
+
+        :param pairs: Iterable of (scryfallId, uuid)
+        """
+        keys = bytearray()
+        values = bytearray()
+
+        for scryfall_id, mtgjson_uuid in pairs:
+            try:
+                key = uuid.UUID(scryfall_id).bytes
+                value = uuid.UUID(mtgjson_uuid).bytes
+            except (ValueError, TypeError, AttributeError):
+                logging.warning(f'Skipping invalid identifiers: {scryfall_id} {mtgjson_uuid}')
+                continue
+
+            keys += key
+            values += value
+
+        keys = numpy.frombuffer(bytes(keys), dtype='S16')
+        values = numpy.frombuffer(bytes(values), dtype='S16')
+
+        # Stable, so the last of any duplicate scryfallId wins (as the previous dict did)
+        order = numpy.argsort(keys, kind='stable')
+
+        self.keys = keys[order]
+        self.values = values[order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, scryfall_id: str, default: str = None) -> Optional[str]:
+        """
+        Find the mtgjson uuid for a scryfallId
+
+        :param scryfall_id: Scryfall card id
+        :param default: Returned when scryfall_id is not found
+        :return: mtgjson uuid
+        """
+        try:
+            key = uuid.UUID(scryfall_id).bytes
+        except (ValueError, TypeError, AttributeError):
+            return default
+
+        position = int(numpy.searchsorted(self.keys, key, side='right')) - 1
+
+        # numpy strips trailing null bytes from fixed-width bytes
+        if position < 0 or self.keys[position].ljust(16, b'\0') != key:
+            return default
+
+        return str(uuid.UUID(bytes=self.values[position].ljust(16, b'\0')))
 
 
 class MTGJson:
@@ -26,30 +93,115 @@ class MTGJson:
 
         return data['data']
 
+    @classmethod
+    def meta_version(cls) -> Optional[str]:
+        """
+        Current mtgjson.com build version, shared by every file of a build
+
+        :return: Version string, or None if Meta.json is unavailable
+        """
+        try:
+            meta = utils.download_file(f'{MTGJSON_API_URL}{Filenames.META.value}')
+            return meta['data']['version']
+
+        except Exception as e:
+            logging.warning(f'Unable to read MTGJson Meta: {e}')
+            return None
+
+    @classmethod
+    def _download(cls, filename: Filenames) -> Path:
+        """
+        Download a file from mtgjson.com through the download cache
+
+        :param filename: mtgjson.com file
+        :return: Path to the cached file
+        """
+        return utils.download_cached(
+            f'{MTGJSON_API_URL}{filename.value}',
+            config.Config.cache_path,
+            version=cls.meta_version(),
+            retries=config.Config.download_retries
+        )
+
+    @classmethod
+    def _trim_prices(cls, paper: dict, days: int) -> dict:
+        """
+        Keep only the latest price points of each price list
+
+        :param paper: Paper pricing of one card ({store: {list_type: {card_type: {date: price}}}})
+        :param days: Number of most recent dates to keep
+        :return: Trimmed paper pricing
+        """
+        for store_vals in paper.values():
+            for card_types in store_vals.values():
+                if not isinstance(card_types, dict):
+                    continue
+
+                for card_type, card_prices in card_types.items():
+                    if isinstance(card_prices, dict) and len(card_prices) > days:
+                        # ISO dates sort chronologically
+                        card_types[card_type] = dict(sorted(card_prices.items())[-days:])
+
+        return paper
+
     @classmethod
     def download_prices(cls) -> dict:
         """
-        Download Paper format Card pricing from
+        Download Paper format Card pricing from mtgjson.com. Only the paper subtree of each card is decoded while
+        streaming; mtgo and other formats are skipped unparsed
 
-        :return: dict containing complete paper format pricing
+        :return: dict of paper format pricing keyed by mtgjson uuid
         """
-        all_prices = cls.download_data(Filenames.ALL_PRICES)
+        days = config.Config.price_days
+        path = cls._download(Filenames.ALL_PRICES)
+
+        # Parsed pricing depends on price_days as well as the upstream version
+        cache = utils.parsed_cache_path(path, f'paper-{days}')
+        prices = utils.load_parsed(cache)
+        if prices is not None:
+            logging.debug(f'Using parsed cache "{cache}"')
+            return prices
 
-        card_format: dict
-        for uuid, card_format in all_prices.items():
-            # Keep only paper pricing
-            for key in list(card_format.keys()):
-                if key != 'paper':
-                    card_format.pop(key)
+        prices = {}
+        with lzma.open(path, mode='rt') as lzma_file:
+            for keys, value in utils.iter_json(lzma_file, ('meta',), ('data', None, 'paper')):
+                if keys == ('meta',):
+                    logging.debug(f'MTGJson Meta {Filenames.ALL_PRICES.value}: {value}')
+                    continue
 
-        return all_prices
+                prices[keys[1]] = cls._trim_prices(value, days) if days else value
+
+        return utils.save_parsed(cache, prices)
+
+    @classmethod
+    def _read_card_identifiers(cls, file: TextIO) -> Iterator[Tuple[str, str]]:
+        """
+        Stream (scryfallId, uuid) for every card in AllPrintings; one card is decoded at a time
+
+        :param file: Decompressed AllPrintings text file
+        :return: Iterator of (scryfallId, uuid)
+        """
+        for keys, value in utils.iter_json(file, ('meta',), ('data', None, 'cards', None)):
+            if keys == ('meta',):
+                logging.debug(f'MTGJson Meta {Filenames.ALL_PRINTINGS.value}: {value}')
+
+            elif value.get('identifiers', {}).get('scryfallId'):
+                yield value['identifiers']['scryfallId'], value['uuid']
 
     @classmethod
-    def download_card_identifiers(cls) -> dict:
-        data = cls.download_data(Filenames.ALL_PRINTINGS)
-        return {
-            card_data.get('identifiers', {}).get('scryfallId'): card_data['uuid']
-            for set_data in data.values()
-            for card_data in set_data['cards']
-            if card_data.get('identifiers', {}).get('scryfallId')
-        }
+    def download_card_identifiers(cls) -> IdentifierMap:
+        """
+        Download AllPrintings and stream out the scryfallId -> uuid identifiers
+
+        :return: IdentifierMap of mtgjson uuid keyed by scryfallId
+        """
+        path = cls._download(Filenames.ALL_PRINTINGS)
+
+        cache = utils.parsed_cache_path(path, 'identifiers')
+        identifiers = utils.load_parsed(cache)
+        if identifiers is not None:
+            logging.debug(f'Using parsed cache "{cache}"')
+            return identifiers
+
+        with lzma.open(path, mode='rt') as lzma_file:
+            return utils.save_parsed(cache, IdentifierMap(cls._read_card_identifiers(lzma_file)))
@@ -1,28 +1,75 @@
 import logging
-from typing import List
+import os
+from pathlib import Path
+from typing import Callable, Iterator
 
+from tdb.cardbot.core import config
 from tdb.cardbot.core import utils
 
 BULK_DATA = 'https://api.scryfall.com/bulk-data'
 
+# Number of cards between progress reports while parsing
+PROGRESS_INTERVAL = 1000
+
 
 class Scryfall:
     @classmethod
-    def download_data(cls) -> List[dict]:
+    def download_data(cls) -> Path:
         """
-        Download 'default_cards' from api.scryfall.com. Used to match scryfall images with mtgjson data
+        Download 'all_cards' from api.scryfall.com. Used to match scryfall images with mtgjson data
 
-        :return: dict containing Scryfall Api Image URL info keyed by scryfallId and cardName
+        :return: Path to the cached all_cards JSON array; read it with read_cards()
         """
         logging.debug(f'Downloading Scryfall Bulk Data')
 
-        # Extract download_uri from bulk data for default_cards
-        download_uri = next(
-            data['download_uri']
+        # Extract all_cards details from bulk data
+        bulk_data = next(
+            data
             for data in utils.download_file(BULK_DATA)['data']
             if data['type'] == 'all_cards'
         )
 
-        default_cards = utils.download_file(download_uri)
+        # updated_at changes with every new all_cards file, so an unchanged file is not requested again
+        return utils.download_cached(
+            bulk_data['download_uri'],
+            config.Config.cache_path,
+            version=bulk_data.get('updated_at'),
+            retries=config.Config.download_retries
+        )
+
+    @classmethod
+    def _parse_cards(cls, path: Path, progress: Callable[[int, int], None] = None) -> Iterator[dict]:
+        """
+        Stream card objects from a downloaded all_cards file, one at a time
+
+        :param path: Path returned by download_data()
+        :param progress: Called with (bytes read, file size) every PROGRESS_INTERVAL cards
+        :return: Iterator of Scryfall card dicts
+        """
+        with open(path, 'r', encoding='utf-8') as text_file:
+            size = os.fstat(text_file.fileno()).st_size
+
+            for count, (_, card_data) in enumerate(utils.iter_json(text_file, (None,))):
+                if progress and not count % PROGRESS_INTERVAL:
+                    progress(text_file.buffer.tell(), size)
 
-        return default_cards
+                yield card_data
+
+            if progress:
+                progress(size, size)
+
+    @classmethod
+    def read_cards(cls, path: Path, progress: Callable[[int, int], None] = None) -> Iterator[dict]:
+        """
+        Stream card objects from a downloaded all_cards file. The parsed cards are cached for the file's updated_at,
+        so an unchanged file is read back without parsing JSON again
+
+        :param path: Path returned by download_data()
+        :param progress: Called with (bytes read, total bytes) of the file being read, the parsed cache or path
+        :return: Iterator of Scryfall card dicts
+        """
+        yield from utils.iter_parsed(
+            utils.parsed_cache_path(path, 'cards'),
+            cls._parse_cards(path, progress),
+            progress=progress
+        )
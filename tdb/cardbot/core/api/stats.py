@@ -0,0 +1,152 @@
+import contextlib
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+from tdb.cardbot.core import config
+from tdb.cardbot.core.crud.job import Job
+from tdb.cardbot.core.database import Database
+
+
+class JobStats:
+    def __init__(self, job_id: Optional[int] = None):
+        """
+        Throughput and stage timing of a running Job. Workers add records and stage seconds from any thread, and
+        start() writes a snapshot to Job.results every Config.stats_interval seconds while the Job runs
+
+        :param job_id: Job to write snapshots to, snapshots are only returned if None
+        """
+        self.job_id = job_id
+
+        self.start_time = time.monotonic()
+        self.ingest_time: Optional[float] = None
+
+        self.records: Dict[str, int] = defaultdict(int)
+        self.stages: Dict[str, float] = defaultdict(float)
+
+        self.bytes_read = 0
+        self.total_bytes = 0
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_records(self, worker: str, count: int = 1):
+        """
+        Count records processed by a worker
+
+        :param worker: Worker name
+        :param count: Number of records
+        """
+        with self._lock:
+            if self.ingest_time is None:
+                self.ingest_time = time.monotonic()
+
+            self.records[worker] += count
+
+    def add_time(self, stage: str, seconds: float):
+        """
+        Add time spent in a stage, summed over every thread or process of the stage
+
+        :param stage: Stage name (download, parse, validate, db_write, images, hash)
+        :param seconds: Elapsed seconds
+        """
+        with self._lock:
+            self.stages[stage] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, stage: str):
+        """
+        Time the enclosed block as part of a stage
+
+        :param stage: Stage name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def progress(self, bytes_read: int, total_bytes: int):
+        """
+        Report how far the source file has been read, used for the ETA
+
+        :param bytes_read: Bytes read so far
+        :param total_bytes: Size of the source file
+        """
+        with self._lock:
+            if self.ingest_time is None:
+                self.ingest_time = time.monotonic()
+
+            self.bytes_read = bytes_read
+            self.total_bytes = total_bytes
+
+    def snapshot(self) -> dict:
+        """
+        Current throughput, stage times and ETA
+
+        :return: dict stored in Job.results
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            ingest = max(now - (self.ingest_time or now), 1e-9)
+            records = dict(self.records)
+            stages = dict(self.stages)
+            fraction = self.bytes_read / self.total_bytes if self.total_bytes else 0.0
+
+        eta = ingest * (1 - fraction) / fraction if fraction else None
+
+        return {
+            'elapsed': round(now - self.start_time, 1),
+            'records': sum(records.values()),
+            'records_per_second': round(sum(records.values()) / ingest, 1),
+            'workers': {
+                worker: {'records': count, 'records_per_second': round(count / ingest, 1)}
+                for worker, count in sorted(records.items())
+            },
+            'stages': {stage: round(seconds, 3) for stage, seconds in sorted(stages.items())},
+            'progress': round(fraction, 4),
+            'eta': round(eta, 1) if eta is not None else None
+        }
+
+    def _write_thread(self):
+        """
+        Write a snapshot to Job.results every Config.stats_interval seconds until close()
+        """
+        while not self._stop.wait(config.Config.stats_interval):
+            try:
+                with Database.db_contextmanager() as db:
+                    job = Job.read_one(db, self.job_id)
+                    job.results = {'stats': self.snapshot()}
+                    db.commit()
+
+            except Exception as e:
+                logging.warning(f'Unable to write Job {self.job_id} stats: {e}')
+
+    def start(self) -> 'JobStats':
+        """
+        Start writing snapshots to Job.results
+
+        :return: self
+        """
+        if self.job_id is not None and config.Config.stats_interval > 0:
+            self._thread = threading.Thread(target=self._write_thread, name='JobStats', daemon=True)
+            self._thread.start()
+
+        return self
+
+    def close(self) -> dict:
+        """
+        Stop writing snapshots
+
+        :return: Final snapshot
+        """
+        self._stop.set()
+
+        if self._thread:
+            self._thread.join()
+
+        return self.snapshot()
@@ -5,6 +5,7 @@ from tdb.cardbot.core import config
 from tdb.cardbot.core import routes
 from tdb.cardbot.core.crud.job import Job
 from tdb.cardbot.core.database import Database
+from tdb.cardbot.core.hashing import Recognizer
 
 
 class App(BaseApp):
@@ -15,9 +16,14 @@ class App(BaseApp):
     def _setup(cls):
         # Bind DB Model Object to each DB Table
         Database.base.metadata.create_all(bind=Database.engine())
+        Database.add_missing_columns()
 
-        # Clear temp table(s)
         with Database.db_contextmanager() as db:
+            # Keep the HashTable resident for recognition requests. Loaded first, the snapshot is checked against
+            # the completed Jobs
+            Recognizer.load(db)
+
+            # Clear temp table(s)
             Job.truncate(db)
 
 
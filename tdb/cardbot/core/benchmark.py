@@ -0,0 +1,483 @@
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+from typing import Iterable, Tuple
+
+import imagehash
+import numpy
+import scipy.fftpack
+from PIL import Image as PillowImage
+
+from tdb.cardbot.core import config
+from tdb.cardbot.core.api import Api
+from tdb.cardbot.core.api.images import _init_hash_process
+from tdb.cardbot.core.hashing import HashTable, MultiIndex, pack_hashes
+from tdb.cardbot.core.image import Image, dct_basis, hash_image
+from tdb.cardbot.core.schemas import NewCard
+
+
+def _random_hash(rng: numpy.random.Generator, hash_size: int) -> imagehash.ImageHash:
+    return imagehash.ImageHash(rng.integers(0, 2, size=(hash_size, hash_size), dtype=numpy.uint8).astype(bool))
+
+
+def _near_hash(rng: numpy.random.Generator, hash_table: HashTable, bits: int) -> imagehash.ImageHash:
+    """
+    Copy a random HashTable row with `bits` random bits flipped
+    """
+    row = numpy.unpackbits(hash_table.hashes[rng.integers(len(hash_table))].view(numpy.uint8))
+    row[rng.choice(len(row), size=bits, replace=False)] ^= 1
+
+    return imagehash.hex_to_hash(numpy.packbits(row).tobytes().hex())
+
+
+def _time_lookups(hash_table: HashTable, queries: list, prefilter_hashes: list = None) -> float:
+    t = time.perf_counter()
+    for query, prefilter_hash in zip(queries, prefilter_hashes or [None] * len(queries)):
+        hash_table.get_closest_match(query, prefilter_hash)
+
+    return (time.perf_counter() - t) / len(queries)
+
+
+def hash_table_lookup(sizes: Iterable[int] = (100_000, 500_000, 1_000_000), *, lookups: int = 20,
+                      hash_size: int = 48) -> dict:
+    """
+    Measure HashTable.get_closest_match latency against random tables. Near queries are a table row with a few bits
+    flipped (answered from the MultiIndex), far queries are random (MultiIndex miss, full scan fallback), and
+    cascade queries are far queries with a prefilter phash (MultiIndex miss, prefilter cascade).
+
+    :param sizes: Table row counts to benchmark
+    :param lookups: Number of lookups timed per table size
+    :param hash_size: phash size (48 -> 2304 bits)
+    :return: dict of mean seconds per (near, far, cascade) lookup keyed by table size
+    """
+    rng = numpy.random.default_rng(0)
+    words = -(-hash_size * hash_size // 64)
+
+    results = {}
+    for size in sizes:
+        t = time.perf_counter()
+        hash_table = HashTable(
+            ids=numpy.array([f'card-{r}'.encode() for r in range(size)]),
+            hashes=rng.integers(0, 2 ** 64, size=(size, words), dtype=numpy.uint64),
+            prefilter=rng.integers(0, 2 ** 64, size=size, dtype=numpy.uint64)
+        )
+        build = time.perf_counter() - t
+
+        near = _time_lookups(hash_table, [_near_hash(rng, hash_table, hash_table.index.radius) for _ in range(lookups)])
+        far_queries = [_random_hash(rng, hash_size) for _ in range(lookups)]
+        far = _time_lookups(hash_table, far_queries)
+        cascade = _time_lookups(hash_table, far_queries, rng.integers(-2 ** 63, 2 ** 63, size=lookups).tolist())
+
+        results[size] = (near, far, cascade)
+
+        print(f'HashTable {size:>9} rows: build {build:.2f}s, near lookup {near * 1000:.2f}ms, '
+              f'far lookup {far * 1000:.2f}ms, cascade lookup {cascade * 1000:.2f}ms')
+
+    return results
+
+
+def _png(image: PillowImage.Image) -> io.BytesIO:
+    """
+    Encode a PIL image as an in-memory png
+    """
+    file = io.BytesIO()
+    image.save(file, 'PNG')
+    file.seek(0)
+
+    return file
+
+
+def _random_images(rng: numpy.random.Generator, path: str, count: int) -> list:
+    """
+    Save `count` random card sized (488x680) png images
+    """
+    paths = []
+    for r in range(count):
+        filename = os.path.join(path, f'{r}.png')
+        PillowImage.fromarray(rng.integers(0, 256, size=(680, 488, 3), dtype=numpy.uint8)).save(filename)
+        paths.append(filename)
+
+    return paths
+
+
+def image_hashing(count: int = 64, processes: Iterable[int] = (1, 2, 4, 8)) -> dict:
+    """
+    Measure phash throughput of the ImageHasher process pool (spawned, as in ImageHasher) against random images
+
+    :param count: Number of images hashed per run
+    :param processes: Process counts to benchmark
+    :return: dict of images per second keyed by process count
+    """
+    rng = numpy.random.default_rng(0)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as path:
+        paths = _random_images(rng, path, count)
+
+        for process_count in processes:
+            with concurrent.futures.ProcessPoolExecutor(
+                    process_count,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_hash_process,
+                    initargs=(config.Config.hash_pixels_height, config.Config.fast_decode)
+            ) as executor:
+                # Start the processes before timing
+                list(executor.map(hash_image, paths[:process_count]))
+
+                t = time.perf_counter()
+                list(executor.map(hash_image, paths))
+                rate = count / (time.perf_counter() - t)
+
+            results[process_count] = rate
+
+            print(f'phash {process_count:>2} processes: {rate:.1f} images/s '
+                  f'({rate / results[min(results)]:.2f}x)')
+
+    return results
+
+
+def phash_dct(count: int = 256, *, hash_size: int = 48, high_freq_factor: int = 4) -> dict:
+    """
+    Compare the phash DCT stage of Image.image_hash (two full scipy DCTs per image) with Image.image_hashes (one
+    batched truncated matrix DCT), and check that both give the same hashes for random card sized images
+
+    :param count: Number of images per batch
+    :param hash_size: phash size
+    :param high_freq_factor: phash frequency factor
+    :return: dict of scipy and matrix seconds per image, and the number of matching hashes
+    """
+    rng = numpy.random.default_rng(0)
+    img_size = hash_size * high_freq_factor
+
+    pixels = rng.integers(0, 256, size=(count, img_size, img_size), dtype=numpy.uint8)
+
+    t = time.perf_counter()
+    for image_pixels in pixels:
+        scipy.fftpack.dct(scipy.fftpack.dct(image_pixels, axis=0), axis=1)[:hash_size, :hash_size]
+    per_scipy = (time.perf_counter() - t) / count
+
+    basis = dct_basis(hash_size, img_size)
+
+    t = time.perf_counter()
+    basis @ pixels.astype(numpy.float64) @ basis.T
+    per_matrix = (time.perf_counter() - t) / count
+
+    # Parity of the full hashing path, on smooth (upscaled) random images like real scans
+    images = []
+    for _ in range(min(count, 64)):
+        image = PillowImage.fromarray(rng.integers(0, 256, size=(68, 49, 3), dtype=numpy.uint8))
+        images.append(Image(_png(image.resize((488, 680), PillowImage.BICUBIC))))
+
+    single = [str(image.image_hash(hash_size, high_freq_factor)) for image in images]
+    batch = [str(image_hash) for image_hash in Image.image_hashes(images, hash_size, high_freq_factor)]
+    matching = sum(a == b for a, b in zip(single, batch))
+
+    print(f'phash DCT: scipy {per_scipy * 1000:.3f}ms/image, matrix batch {per_matrix * 1000:.3f}ms/image '
+          f'({per_scipy / per_matrix:.1f}x), identical hashes {matching}/{len(images)}')
+
+    return {'scipy': per_scipy, 'matrix': per_matrix, 'matching': matching}
+
+
+def _z_transform_pil(image: PillowImage.Image) -> numpy.ndarray:
+    """
+    Previous PIL based Image.z_transform, kept as the parity reference
+    """
+    data = image.getdata()
+    quantiles = numpy.arange(100)
+    quantiles_values = numpy.percentile(data, quantiles)
+    image.putdata((numpy.interp(data, quantiles_values, quantiles) / 100 * 255).astype(numpy.uint8))
+
+    return numpy.asarray(image)
+
+
+def z_transform(count: int = 50, *, img_size: int = 192) -> dict:
+    """
+    Compare Image.z_transform (histogram lookup table) with the previous PIL getdata/percentile/putdata version
+
+    :param count: Number of random grayscale images
+    :param img_size: Image size (phash input size)
+    :return: dict of pil and lut seconds per image, and the number of identical results
+    """
+    rng = numpy.random.default_rng(0)
+    images = [rng.integers(0, 256, size=(img_size, img_size), dtype=numpy.uint8) for _ in range(count)]
+
+    t = time.perf_counter()
+    expected = [_z_transform_pil(PillowImage.fromarray(pixels)) for pixels in images]
+    per_pil = (time.perf_counter() - t) / count
+
+    t = time.perf_counter()
+    results = [Image.z_transform(pixels) for pixels in images]
+    per_lut = (time.perf_counter() - t) / count
+
+    matching = sum(numpy.array_equal(a, b) for a, b in zip(expected, results))
+
+    print(f'z_transform: pil {per_pil * 1000:.2f}ms/image, lut {per_lut * 1000:.2f}ms/image '
+          f'({per_pil / per_lut:.1f}x), identical {matching}/{count}')
+
+    return {'pil': per_pil, 'lut': per_lut, 'matching': matching}
+
+
+def _card_image(rng: numpy.random.Generator) -> PillowImage.Image:
+    """
+    Random smooth card sized (488x680) RGBA image with transparent rounded corners, like a Scryfall png
+    """
+    image = PillowImage.fromarray(rng.integers(0, 256, size=(68, 49, 3), dtype=numpy.uint8))
+    image = image.resize((488, 680), PillowImage.BICUBIC).convert('RGBA')
+
+    alpha = numpy.full((680, 488), 255, dtype=numpy.uint8)
+    alpha[:20, :20] = alpha[:20, -20:] = alpha[-20:, :20] = alpha[-20:, -20:] = 0
+    image.putalpha(PillowImage.fromarray(alpha))
+
+    return image
+
+
+def _time_hashes(files: list, fast: bool) -> Tuple[float, list]:
+    t = time.perf_counter()
+    hashes = []
+    for file in files:
+        file.seek(0)
+        hashes.append(Image(file, fast=fast).image_hash())
+
+    return (time.perf_counter() - t) / len(files), hashes
+
+
+def image_decode(count: int = 32) -> dict:
+    """
+    Compare the full decode path (resize to hash_pixels_height, alpha canvas, resize to hash size) with the fast
+    decode path, for Scryfall style pngs and camera style (1920x1080) jpegs
+
+    :param count: Number of images per format
+    :return: dict of (full, fast) seconds per image and mean hamming distance between the hashes, keyed by format
+    """
+    rng = numpy.random.default_rng(0)
+
+    cards = [_card_image(rng) for _ in range(count)]
+    files = {
+        'png': [_png(card) for card in cards],
+        'jpeg': []
+    }
+
+    for card in cards:
+        frame = PillowImage.new('RGB', (1920, 1080), (40, 40, 40))
+        frame.paste(card.resize((680, 947)), (620, 66), mask=card.resize((680, 947)))
+
+        file = io.BytesIO()
+        frame.save(file, 'JPEG', quality=90)
+        files['jpeg'].append(file)
+
+    results = {}
+    for image_format, format_files in files.items():
+        full, full_hashes = _time_hashes(format_files, False)
+        fast, fast_hashes = _time_hashes(format_files, True)
+        distance = numpy.mean([a - b for a, b in zip(full_hashes, fast_hashes)])
+
+        results[image_format] = (full, fast, distance)
+
+        print(f'decode {image_format:>4}: full {full * 1000:.1f}ms/image, fast {fast * 1000:.1f}ms/image '
+              f'({full / fast:.1f}x), mean hash distance {distance:.1f} bits of {full_hashes[0].hash.size}')
+
+    return results
+
+
+def _capture(card: PillowImage.Image) -> Image:
+    """
+    Camera style copy of a card image: blurred, brighter and jpeg compressed
+    """
+    from PIL import ImageEnhance, ImageFilter
+
+    distorted = ImageEnhance.Brightness(card.convert('RGB').filter(ImageFilter.GaussianBlur(2))).enhance(1.2)
+    file = io.BytesIO()
+    distorted.save(file, 'JPEG', quality=40)
+    file.seek(0)
+
+    return Image(file)
+
+
+def prefilter_cascade(count: int = 200, candidates: Iterable[int] = (5, 10, 20, 50)) -> dict:
+    """
+    Measure how often the prefilter cascade finds the same closest Card as a full phash scan, for distorted
+    (blurred, jpeg compressed, shifted brightness) copies of random card images. The MultiIndex is disabled so
+    every query goes through the cascade.
+
+    :param count: Number of card images in the table
+    :param candidates: Config.hash_prefilter_candidates values to test
+    :return: dict of the fraction of matching closest Cards keyed by candidate count
+    """
+    rng = numpy.random.default_rng(0)
+
+    hashes = []
+    prefilter = []
+    queries = []
+    for _ in range(count):
+        card = _card_image(rng)
+
+        image = Image(_png(card))
+        hashes.append(str(image.image_hash()))
+        prefilter.append(image.prefilter_hash())
+
+        query = _capture(card)
+        queries.append((query.image_hash(), query.prefilter_hash()))
+
+    hash_table = HashTable(
+        ids=numpy.array([f'card-{r}'.encode() for r in range(count)]),
+        hashes=pack_hashes(hashes),
+        index=MultiIndex.build(pack_hashes(hashes), 0),
+        prefilter=numpy.array(prefilter, dtype=numpy.int64).view(numpy.uint64)
+    )
+
+    expected = [hash_table.get_closest_match(image_hash) for image_hash, _ in queries]
+
+    results = {}
+    default = config.Config.hash_prefilter_candidates
+    try:
+        for candidate_count in candidates:
+            config.Config.hash_prefilter_candidates = candidate_count
+
+            found = [hash_table.get_closest_match(image_hash, prefilter_hash) for image_hash, prefilter_hash in queries]
+            results[candidate_count] = sum(a == b for a, b in zip(expected, found)) / count
+
+            print(f'prefilter cascade {candidate_count:>4} of {count} candidates: '
+                  f'{results[candidate_count] * 100:.1f}% same closest Card as a full scan')
+    finally:
+        config.Config.hash_prefilter_candidates = default
+
+    return results
+
+
+def index_hit_rate(count: int = 200, substrings: Iterable[int] = (32, 64, 96, 144)) -> dict:
+    """
+    Measure how often the MultiIndex answers a closest Card lookup on its own, for distorted (blurred, jpeg
+    compressed, shifted brightness) copies of random card images. A lookup is a hit when the card is within the
+    index radius, otherwise it falls back to a full scan.
+
+    :param count: Number of card images in the table
+    :param substrings: Config.hash_index_substrings values to test
+    :return: dict of (hit rate, mean seconds per lookup) keyed by substring count
+    """
+    rng = numpy.random.default_rng(0)
+
+    hashes = []
+    queries = []
+    for _ in range(count):
+        card = _card_image(rng)
+        hashes.append(str(Image(_png(card)).image_hash()))
+        queries.append(_capture(card).image_hash())
+
+    packed = pack_hashes(hashes)
+    distances = [imagehash.hex_to_hash(record_hash) - query for record_hash, query in zip(hashes, queries)]
+
+    print(f'MultiIndex capture distances: median {numpy.median(distances):.0f}, max {max(distances)} bits')
+
+    results = {}
+    for substring_count in substrings:
+        hash_table = HashTable(
+            ids=numpy.array([f'card-{r}'.encode() for r in range(count)]),
+            hashes=packed,
+            index=MultiIndex.build(packed, substring_count)
+        )
+
+        hits = sum(distance <= hash_table.index.radius for distance in distances) / count
+        results[substring_count] = (hits, _time_lookups(hash_table, queries))
+
+        print(f'MultiIndex {substring_count:>3} substrings (radius {hash_table.index.radius:>3}): '
+              f'{hits * 100:.1f}% hits, {results[substring_count][1] * 1000:.2f}ms per lookup')
+
+    return results
+
+
+def _scryfall_card(rng: numpy.random.Generator, number: int) -> dict:
+    """
+    Scryfall style card dict, with the numeric and unmapped fields of the bulk data
+    """
+    return {
+        'object': 'card',
+        'id': f'{number:08x}-0000-0000-0000-000000000000',
+        'oracle_id': f'{number:08x}-1111-1111-1111-111111111111',
+        'mtgo_id': int(rng.integers(1, 100000)),
+        'tcgplayer_id': int(rng.integers(1, 100000)),
+        'cardmarket_id': int(rng.integers(1, 100000)),
+        'name': f'Card {number}',
+        'lang': 'en',
+        'released_at': '2020-01-01',
+        'uri': f'https://api.scryfall.com/cards/{number}',
+        'layout': 'normal',
+        'highres_image': True,
+        'image_status': 'highres_scan',
+        'mana_cost': '{2}{G}',
+        'cmc': float(rng.integers(0, 10)),
+        'type_line': 'Creature — Elf',
+        'oracle_text': 'Flying ' * int(rng.integers(1, 20)),
+        'power': '2',
+        'toughness': '2',
+        'colors': ['G'],
+        'color_identity': ['G'],
+        'keywords': ['Flying'],
+        'legalities': {'standard': 'legal', 'modern': 'legal', 'legacy': 'legal'},
+        'games': ['paper', 'mtgo'],
+        'reserved': False,
+        'foil': True,
+        'nonfoil': True,
+        'oversized': False,
+        'promo': False,
+        'reprint': bool(rng.integers(2)),
+        'variation': False,
+        'set': 'abc',
+        'set_name': 'Alphabet',
+        'collector_number': str(number),
+        'rarity': 'common',
+        'artist': 'Artist',
+        'border_color': 'black',
+        'frame': '2015',
+        'full_art': False,
+        'textless': False,
+        'prices': {'usd': '0.10', 'usd_foil': '0.25', 'eur': None},
+        'scryfall_id': f'{number:08x}-0000-0000-0000-000000000000',
+        'mtgjson_uuid': f'{number:08x}-2222-2222-2222-222222222222',
+        'digest': f'{number:040x}',
+        'object_type': 'card',
+        'image_url': f'https://cards.scryfall.io/png/{number}.png',
+        'image_local': f'en/abc/Card {number}.png',
+        'tcgplayer_retail_normal': {'2020-01-01': 0.1},
+        'tcgplayer_retail_foil': {'2020-01-01': 0.25},
+    }
+
+
+def card_mapping(count: int = 5000) -> dict:
+    """
+    Compare the ingestion fast path (Api._map_card, column whitelist and one coercion pass) with pydantic
+    (NewCard(**card_data).dict()), and check that both give the same Card column dicts
+
+    :param count: Number of card dicts
+    :return: seconds per card of each path
+    """
+    rng = numpy.random.default_rng(0)
+    cards = [_scryfall_card(rng, number) for number in range(count)]
+
+    t = time.perf_counter()
+    validated = [NewCard(**card_data).dict() for card_data in cards]
+    pydantic_time = (time.perf_counter() - t) / count
+
+    t = time.perf_counter()
+    mapped = [Api._map_card(card_data) for card_data in cards]
+    mapped_time = (time.perf_counter() - t) / count
+
+    assert mapped == validated, 'Card column dicts differ'
+
+    print(f'card mapping pydantic: {pydantic_time * 1e6:.1f}us/card, fast: {mapped_time * 1e6:.1f}us/card '
+          f'({pydantic_time / mapped_time:.1f}x), {count} identical rows')
+
+    return {'pydantic': pydantic_time, 'fast': mapped_time}
+
+
+if __name__ == '__main__':
+    hash_table_lookup()
+    image_hashing()
+    phash_dct()
+    z_transform()
+    image_decode()
+    prefilter_cascade()
+    index_hit_rate()
+    card_mapping()
@@ -6,9 +6,24 @@ from tdb.cardbot.config import BaseConfig
 
 class Config(BaseConfig):
     app: str = 'tdb.cardbot.core.app:App'
+    batch_size: int = 500
+    cache_path: str = '/cache/'
+    download_retries: int = 3
+    fast_decode: bool = False
+    hash_index_substrings: int = 144
+    hash_snapshot: str = '/hash_table.snapshot'
     hash_pixels_height: int = 1000
+    hash_prefilter_candidates: int = 1000
+    hash_processes: int = 1
     image_path: str = '/images/'
+    image_threads: int = 8
+    ingest_processes: int = 0
+    match_top_k: int = 5
     max_threads: int = 1
+    price_days: int = 0
+    queue_size: int = 1000
+    stats_interval: int = 10
+    validate_cards: bool = False
 
     @classmethod
     def _load(cls, details: dict):
@@ -24,6 +39,25 @@ class Config(BaseConfig):
         # Create path if it doesn't exist
         os.makedirs(cls.image_path, exist_ok=True)
 
+        # Packed HashTable snapshot is stored next to image_path
+        cls.hash_snapshot = details.get('hash_snapshot', str(Path(cls.image_path).parent / 'hash_table.snapshot'))
+
+        # Bulk downloads are cached next to image_path
+        cls.cache_path = details.get('cache_path', str(Path(cls.image_path).parent / 'cache'))
+
         # Load remaining Core Config details
+        cls.batch_size = details.get('batch_size', cls.batch_size)
+        cls.download_retries = details.get('download_retries', cls.download_retries)
+        cls.fast_decode = details.get('fast_decode', cls.fast_decode)
+        cls.hash_index_substrings = details.get('hash_index_substrings', cls.hash_index_substrings)
         cls.hash_pixels_height = details.get('hash_pixels_height', cls.hash_pixels_height)
+        cls.hash_prefilter_candidates = details.get('hash_prefilter_candidates', cls.hash_prefilter_candidates)
+        cls.hash_processes = details.get('hash_processes', os.cpu_count() or cls.hash_processes)
+        cls.image_threads = details.get('image_threads', cls.image_threads)
+        cls.ingest_processes = details.get('ingest_processes', cls.ingest_processes)
+        cls.match_top_k = details.get('match_top_k', cls.match_top_k)
         cls.max_threads = details.get('max_threads', os.cpu_count() or cls.max_threads)
+        cls.price_days = details.get('price_days', cls.price_days)
+        cls.queue_size = details.get('queue_size', cls.queue_size)
+        cls.stats_interval = details.get('stats_interval', cls.stats_interval)
+        cls.validate_cards = details.get('validate_cards', cls.validate_cards)
@@ -1,8 +1,10 @@
 import logging
 from abc import ABC
-from typing import List, TypeVar, Callable
+from collections import defaultdict
+from typing import List, TypeVar, Callable, Tuple, Union, Sequence
 
-from sqlalchemy import Column
+from sqlalchemy import Column, case, cast, func, null
+from sqlalchemy.dialects.postgresql import insert, JSONB
 from sqlalchemy.orm import Session
 
 from tdb.cardbot.core.database import Database
@@ -17,6 +19,12 @@ class CRUD(ABC):
     model_class: Callable = None
     model_column: Column = None
 
+    # JSON dict columns merged with the stored value on upsert, instead of replaced
+    merge_columns: Tuple[Column, ...] = ()
+
+    # PostgreSQL limit on bind parameters per statement
+    max_parameters: int = 65535
+
     @classmethod
     def create(cls, db: Session, schema: Schema, *, commit: bool = True) -> Model:
         """
@@ -121,3 +129,114 @@ class CRUD(ABC):
             model = cls.create(db, schema, commit=commit)
 
         return model
+
+    @classmethod
+    def _merge_rows(cls, rows: List[dict]) -> List[dict]:
+        """
+        Combine rows sharing a key (ON CONFLICT can only update a row once per statement); later rows win and
+        merge_columns dicts are merged
+
+        :param rows: List of column dicts
+        :return: List of column dicts with unique keys
+        """
+        key = cls.model_column.name
+        merge_names = [column.name for column in cls.merge_columns]
+
+        unique = {}
+        for row in rows:
+            old = unique.get(row[key])
+
+            if old:
+                row = {**old, **row}
+                for name in merge_names:
+                    if isinstance(old.get(name), dict):
+                        row[name] = {**old[name], **(row[name] or {})}
+
+            unique[row[key]] = row
+
+        return list(unique.values())
+
+    @classmethod
+    def _merge_json(cls, column: Column, excluded: Column):
+        """
+        Merged value of a merge_column: the stored dict updated with the new dict. A value that is not a JSON object
+        (SQL NULL, JSON null, or an array left by earlier merges) is replaced instead of merged
+
+        :param column: Stored column
+        :param excluded: New column value (EXCLUDED)
+        :return: SQL expression
+        """
+        column_object = func.jsonb_typeof(cast(column, JSONB)) == 'object'
+        excluded_object = func.jsonb_typeof(cast(excluded, JSONB)) == 'object'
+
+        return case(
+            (column_object & excluded_object, cast(cast(column, JSONB).op('||')(cast(excluded, JSONB)), column.type)),
+            (excluded_object, excluded),
+            (column_object, column),
+            else_=null()
+        )
+
+    @classmethod
+    def upsert_many(cls, db: Session, schemas: List[Union[Schema, dict]], *, returning: Sequence[Column] = (),
+                    commit: bool = True) -> list:
+        """
+        Update existing records, or Insert new records, in bulk using INSERT ... ON CONFLICT DO UPDATE.
+        merge_columns are merged server-side with the stored JSON dict (jsonb ||, which also sorts the keys)
+
+        :param db: SqlAlchemy DB Session
+        :param schemas: List of Pydantic Schema Objects or column dicts
+        :param returning: Columns to return for every written record
+        :param commit: Bool - Should this perform an immediate commit
+        :return: List of rows with the returning columns
+        """
+        table = cls.model_class.__table__
+        key = cls.model_column.name
+        merge_names = [column.name for column in cls.merge_columns]
+
+        rows = cls._merge_rows([
+            schema if isinstance(schema, dict) else schema.dict()
+            for schema in schemas
+        ])
+
+        # Multi-row VALUES need the same columns on every row
+        groups = defaultdict(list)
+        for row in rows:
+            groups[tuple(sorted(row))].append(row)
+
+        results = []
+        for names, group in groups.items():
+            batch_size = max(1, cls.max_parameters // len(names))
+
+            for start in range(0, len(group), batch_size):
+                statement = insert(table).values(group[start:start + batch_size])
+
+                updates = {}
+                for name in names:
+                    if name == key:
+                        continue
+
+                    column = table.c[name]
+                    excluded = statement.excluded[name]
+
+                    if name in merge_names:
+                        updates[name] = cls._merge_json(column, excluded)
+                    else:
+                        updates[name] = excluded
+
+                if updates:
+                    statement = statement.on_conflict_do_update(index_elements=[key], set_=updates)
+                else:
+                    statement = statement.on_conflict_do_nothing(index_elements=[key])
+
+                if returning:
+                    statement = statement.returning(*returning)
+                    results += db.execute(statement).fetchall()
+                else:
+                    db.execute(statement)
+
+        if commit:
+            db.commit()
+
+        logging.debug(f'Upserted {len(rows)} {cls.__name__}')
+
+        return results
@@ -1,6 +1,6 @@
-from typing import TypeVar, Callable, List
+from typing import TypeVar, Callable, List, Iterator, Tuple, Dict, Optional
 
-from sqlalchemy import Column
+from sqlalchemy import Column, select, update, bindparam, or_, and_, func
 from sqlalchemy.orm import Session
 
 from tdb.cardbot.core import schemas, models
@@ -14,6 +14,21 @@ class Card(CRUD):
     model_class: Callable = models.Card
     model_column: Column = models.Card.id
 
+    merge_columns: Tuple[Column, ...] = (
+        models.Card.legalities,
+        models.Card.prices,
+        models.Card.cardkingdom_buylist_foil,
+        models.Card.cardkingdom_buylist_normal,
+        models.Card.cardkingdom_retail_foil,
+        models.Card.cardkingdom_retail_normal,
+        models.Card.cardmarket_retail_foil,
+        models.Card.cardmarket_retail_normal,
+        models.Card.tcgplayer_buylist_foil,
+        models.Card.tcgplayer_buylist_normal,
+        models.Card.tcgplayer_retail_foil,
+        models.Card.tcgplayer_retail_normal,
+    )
+
     id: str
     phash_32: str
     set: str
@@ -22,13 +37,97 @@ class Card(CRUD):
     image_local: str
 
     @classmethod
-    def read_all_hashes(cls, db: Session) -> List[models.Card]:
+    def read_hash_batches(cls, db: Session,
+                          batch_size: int = 10000) -> Iterator[List[Tuple[str, str, Optional[int]]]]:
+        """
+        Stream (id, phash_32, phash_8) of all records with a phash, using a server-side cursor. No ORM objects are
+        built
+
+        :param db: SqlAlchemy DB Session
+        :param batch_size: Number of rows fetched per batch
+        :return: Iterator of List[(id, phash_32, phash_8)]
+        """
+        result = db.execute(
+            select(models.Card.id, models.Card.phash_32, models.Card.phash_8)
+            .where(models.Card.phash_32.isnot(None))
+            .execution_options(stream_results=True)
+        )
+
+        for partition in result.partitions(batch_size):
+            yield partition
+
+    @classmethod
+    def read_image_batches(cls, db: Session, batch_size: int = 10000) -> Iterator[List[Tuple[str, str]]]:
+        """
+        Stream (id, image_local) of all records with an image, using a server-side cursor
+
+        :param db: SqlAlchemy DB Session
+        :param batch_size: Number of rows fetched per batch
+        :return: Iterator of List[(id, image_local)]
+        """
+        result = db.execute(
+            select(models.Card.id, models.Card.image_local)
+            .where(models.Card.image_url.isnot(None))
+            .where(models.Card.image_local.isnot(None))
+            .execution_options(stream_results=True)
+        )
+
+        for partition in result.partitions(batch_size):
+            yield partition
+
+    @classmethod
+    def update_hashes(cls, db: Session, hashes: Dict[str, Tuple[str, Optional[int]]], *, commit: bool = True):
+        """
+        Set phash_32 and phash_8 on many records with one executemany UPDATE
+
+        :param db: SqlAlchemy DB Session
+        :param hashes: (phash str, prefilter phash int) keyed by Card id
+        :param commit: Bool - Should this perform an immediate commit
+        """
+        if hashes:
+            db.execute(
+                update(models.Card.__table__)
+                .where(models.Card.__table__.c.id == bindparam('card_id'))
+                .values(phash_32=bindparam('phash'), phash_8=bindparam('phash_8')),
+                [
+                    {'card_id': card_id, 'phash': phash, 'phash_8': phash_8}
+                    for card_id, (phash, phash_8) in hashes.items()
+                ]
+            )
+
+        if commit:
+            db.commit()
+
+    @classmethod
+    def read_digests(cls, db: Session, batch_size: int = 10000) -> Dict[str, str]:
         """
-        Pull all records with a phash
+        Read the content digest of every Scryfall card whose rows (the card and each of its faces) are all fully
+        processed (has a digest and both phash, or has no image). A card with any unfinished face is not returned,
+        so it is not skipped and the face is retried
 
         :param db: SqlAlchemy DB Session
-        :return: List[Card]
+        :param batch_size: Number of rows fetched per batch
+        :return: digest keyed by scryfall_id
         """
-        return db.query(models.Card).filter(
-            models.Card.phash_32 is not None
-        ).all()
+        finished = and_(
+            models.Card.digest.isnot(None),
+            or_(
+                and_(models.Card.phash_32.isnot(None), models.Card.phash_8.isnot(None)),
+                models.Card.image_url.is_(None)
+            )
+        )
+
+        result = db.execute(
+            select(models.Card.scryfall_id, func.min(models.Card.digest))
+            .where(models.Card.scryfall_id.isnot(None))
+            .group_by(models.Card.scryfall_id)
+            .having(func.bool_and(finished))
+            .having(func.count(models.Card.digest.distinct()) == 1)
+            .execution_options(stream_results=True)
+        )
+
+        return {
+            scryfall_id: digest
+            for partition in result.partitions(batch_size)
+            for scryfall_id, digest in partition
+        }
@@ -1,4 +1,4 @@
-from typing import TypeVar, Callable, Union
+from typing import TypeVar, Callable, Union, Optional
 
 from sqlalchemy import Column
 from sqlalchemy.orm import Session
@@ -30,3 +30,18 @@ class Job(CRUD):
                 .filter(models.Job.job_type == key) \
                 .order_by(cls.model_column.desc()) \
                 .first()
+
+    @classmethod
+    def read_last_complete(cls, db: Session, job_type: str) -> Optional[Model]:
+        """
+        Read the most recently completed record for a Job Type
+
+        :param db: SqlAlchemy DB Session
+        :param job_type: Job Type (JobPool class name)
+        :return: DB Model Record
+        """
+        return db.query(cls.model_class) \
+            .filter(models.Job.job_type == job_type) \
+            .filter(models.Job.status == 'complete') \
+            .order_by(models.Job.end_time.desc()) \
+            .first()
@@ -1,7 +1,7 @@
 import os
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 
@@ -42,6 +42,28 @@ class Database:
 
         return cls._local_session
 
+    @classmethod
+    def add_missing_columns(cls):
+        """
+        Add model columns missing from existing tables (create_all only creates missing tables)
+        """
+        engine = cls.engine()
+        inspector = inspect(engine)
+
+        with engine.begin() as connection:
+            for table in cls.base.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+
+                for column in table.columns:
+                    if column.name not in existing:
+                        column_type = column.type.compile(dialect=engine.dialect)
+                        connection.execute(
+                            f'ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS {column.name} {column_type}'
+                        )
+
     @classmethod
     def get_db(cls):
         db = cls.local_session()()
@@ -1,9 +1,13 @@
+import datetime
+import logging
 import threading
 from abc import ABC, abstractmethod
 
 from tdb.cardbot.core import models
+from tdb.cardbot.profiling import Profiler
 from tdb.cardbot.core.crud.job import Job
 from tdb.cardbot.core.database import Database
+from tdb.cardbot.core.hashing import HashTable, Recognizer
 from tdb.cardbot.core.schemas import JobDetails
 
 
@@ -17,6 +21,58 @@ class JobPool(ABC):
     def _run(cls, **kwargs):
         pass
 
+    @classmethod
+    def _start(cls, details: JobDetails, profile: bool, **kwargs):
+        """
+        Background thread running the Job. The lock is released even if the Job fails, otherwise no later Job could
+        start
+
+        :param details: Job details
+        :param profile: Run the Job under the sampling profiler (Config.profile_job)
+        :param kwargs: Dict passed to the function as kwargs
+        """
+        try:
+            if profile:
+                with Profiler.profile(f'job-{cls.__name__}-{details.job_id}'):
+                    cls._run(details, **kwargs)
+            else:
+                cls._run(details, **kwargs)
+
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def _complete(cls, details: JobDetails, results: dict, refresh_hashes: bool = True):
+        """
+        Store the Job results and mark it complete, unless it was stopped
+
+        :param details: Job details
+        :param results: Job results
+        :param refresh_hashes: Emit a fresh HashTable snapshot and swap it into the running Recognizer when complete
+        """
+        with Database.db_contextmanager() as db:
+            # Refresh details
+            job = Job.read_one(db, details.job_id)
+
+            job.results = results
+
+            if job.status == 'running':
+                job.status = 'complete'
+
+            job.end_time = datetime.datetime.now()
+
+            db.commit()
+
+            logging.debug(f'Completed {cls.__name__}: {details.job_id}')
+
+            if refresh_hashes and job.status == 'complete':
+                # The Job is already committed, a failure only leaves the previous table in use until the next load
+                try:
+                    HashTable.write_snapshot(db)
+                    Recognizer.reload()
+                except Exception:
+                    logging.exception(f'Unable to refresh HashTable after Job {details.job_id}')
+
     @classmethod
     async def run(cls, **kwargs) -> models.Job:
         """
@@ -34,7 +90,11 @@ class JobPool(ABC):
 
                 # TODO - Should this be multiprocessing instead of threading
                 #        Must run in background and continue
-                thread = threading.Thread(target=cls._run, args=(details,), kwargs=kwargs)
+                thread = threading.Thread(
+                    target=cls._start,
+                    args=(details, Profiler.take_job(cls.__name__)),
+                    kwargs=kwargs
+                )
                 thread.start()
             else:
                 details = Job.read_one(db, cls.last_job_id)
@@ -1,65 +1,663 @@
+import io
 import logging
+import mmap
+import os
+import struct
+import tempfile
 import time
-from typing import List
+from typing import List, Optional, Tuple
 
 import imagehash
+import numpy
 from sqlalchemy.orm import Session
 
+from tdb.cardbot import metrics
+from tdb.cardbot.core import config
 from tdb.cardbot.core.crud.card import Card
+from tdb.cardbot.core.crud.job import Job
+from tdb.cardbot.core.image import Image
+from tdb.cardbot.core.schemas import HashMatch, MatchResults
 
+# Number of rows compared per block; bounds the XOR temporaries to a few MB
+BLOCK_ROWS = 65536
 
-class HashRow:
-    uuid: str
-    record_hash: str
-    image_hash: imagehash.ImageHash
+# Largest k accepted by /recognize; the top k is a sort over the index candidates or a full scan
+MAX_TOP_K = 100
 
-    def __init__(self, uuid: str, record_hash: str):
+# Snapshot file layout: header, then hashes, ids, index offsets, index order and prefilter hashes; each section 64
+# byte aligned
+SNAPSHOT_MAGIC = b'CBHT'
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct('<4sIQIIIId')
+SNAPSHOT_ALIGN = 64
+
+LOOKUP_SECONDS = metrics.Histogram(
+    'cardbot_hash_lookup_duration_seconds',
+    'HashTable lookup latency',
+    ('method',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5)
+)
+LOOKUP_CANDIDATES = metrics.Histogram(
+    'cardbot_hash_lookup_candidates',
+    'Rows ranked by full phash distance per lookup, by search path (index, cascade or scan)',
+    ('path',),
+    buckets=(1, 10, 100, 1000, 10000, 100000, 1000000)
+)
+INDEX_LOOKUPS = metrics.Counter(
+    'cardbot_hash_index_lookups',
+    'HashTable lookups by how many of the rows needed the MultiIndex found within its radius (hit, partial or miss)',
+    ('result',)
+)
+
+# Fallback popcount lookup for numpy versions without numpy.bitwise_count (< 2.0)
+_POPCOUNT_TABLE = numpy.array([bin(i).count('1') for i in range(256)], dtype=numpy.uint8)
+
+
+def pack_hashes(record_hashes: List[str]) -> numpy.ndarray:
+    """
+    Pack phash hex strs into a contiguous uint64 matrix, one row per hash
+
+    :param record_hashes: phash strs as stored in DB Record (all the same length)
+    :return: numpy.ndarray[uint64] shaped (len(record_hashes), words)
+    """
+    if not record_hashes:
+        return numpy.zeros((0, 0), dtype=numpy.uint64)
+
+    if len(record_hashes[0]) % 2:
+        # Whole bytes are required by bytes.fromhex
+        record_hashes = [h.zfill(len(h) + 1) for h in record_hashes]
+
+    size = len(record_hashes[0]) // 2
+    padding = '00' * (-size % 8)
+
+    data = bytes.fromhex(padding.join(record_hashes) + padding)
+
+    return numpy.frombuffer(data, dtype=numpy.uint64).reshape(len(record_hashes), -1)
+
+
+def pack_hash(record_hash: str) -> numpy.ndarray:
+    """
+    Pack a single phash hex str into uint64 words
+
+    :param record_hash: phash str as stored in DB Record
+    :return: numpy.ndarray[uint64] shaped (words,)
+    """
+    return pack_hashes([record_hash])[0]
+
+
+def popcount(words: numpy.ndarray) -> numpy.ndarray:
+    """
+    Count set bits of each uint64 row
+
+    :param words: numpy.ndarray[uint64] shaped (rows, words)
+    :return: numpy.ndarray[uint32] bit count per row
+    """
+    if hasattr(numpy, 'bitwise_count'):
+        return numpy.bitwise_count(words).sum(axis=1, dtype=numpy.uint32)
+
+    return _POPCOUNT_TABLE[words.view(numpy.uint8)].sum(axis=1, dtype=numpy.uint32)
+
+
+def pack_prefilter(prefilter_hash: int) -> numpy.ndarray:
+    """
+    Pack a signed 64 bit prefilter phash (as stored in DB Record) into one uint64 word
+
+    :param prefilter_hash: Signed 64 bit int
+    :return: numpy.ndarray[uint64] shaped (1,)
+    """
+    return numpy.array([prefilter_hash], dtype=numpy.int64).view(numpy.uint64)
+
+
+def hamming_distances(hashes: numpy.ndarray, packed_hash: numpy.ndarray) -> numpy.ndarray:
+    """
+    Hamming distance between one packed hash and every row of a packed hash matrix (XOR + popcount)
+
+    :param hashes: numpy.ndarray[uint64] shaped (rows, words)
+    :param packed_hash: numpy.ndarray[uint64] shaped (words,)
+    :return: numpy.ndarray[uint32] distance per row
+    """
+    distances = numpy.empty(len(hashes), dtype=numpy.uint32)
+
+    for start in range(0, len(hashes), BLOCK_ROWS):
+        block = hashes[start:start + BLOCK_ROWS]
+        distances[start:start + len(block)] = popcount(numpy.bitwise_xor(block, packed_hash))
+
+    return distances
+
+
+class MultiIndex:
+    offsets: numpy.ndarray
+    order: numpy.ndarray
+
+    def __init__(self, offsets: numpy.ndarray, order: numpy.ndarray):
+        """
+        Multi-index hashing over 16 bit phash substrings.
+
+        Each indexed substring has a bucket table: rows sharing a substring value are stored together in order,
+        with offsets[substring, value] marking where that value's bucket starts. Any row within `radius` bits of a
+        query shares at least one indexed substring exactly with it, so is always found in those buckets.
+
+        :param offsets: numpy.ndarray[uint32] shaped (substrings, 65537) bucket start positions
+        :param order: numpy.ndarray[uint32] shaped (substrings, rows) row indexes grouped by substring value
+        """
+        self.offsets = offsets
+        self.order = order
+
+    @property
+    def radius(self) -> int:
+        """
+        Largest hamming distance guaranteed to be found by candidates()
         """
-        Holds phash details
-            image_hash: ImageHash
+        return len(self.order) - 1
 
-        :param uuid: MTGJson uuid
-        :param record_hash: phash str as stored in DB Record
+    @classmethod
+    def build(cls, hashes: numpy.ndarray, substrings: int) -> 'MultiIndex':
         """
-        self.uuid = uuid
-        self.record_hash = record_hash
-        self.image_hash = imagehash.hex_to_hash(record_hash)
+        Index the leading substrings of every hash. phash bits are ordered from the lowest DCT frequencies, which are
+        the most stable between a scan and a camera capture.
+
+        The radius is one less than the number of substrings. A scan and a capture of the same card differ by about
+        60-120 of 2304 bits, so a 48x48 phash needs all 144 substrings indexed for those matches to be within it.
+
+        :param hashes: numpy.ndarray[uint64] shaped (rows, words)
+        :param substrings: Number of 16 bit substrings to index
+        :return: MultiIndex
+        """
+        values = numpy.ascontiguousarray(hashes).view(numpy.uint16)
+        substrings = min(substrings, values.shape[1])
+
+        offsets = numpy.zeros((substrings, 65537), dtype=numpy.uint32)
+        order = numpy.empty((substrings, len(values)), dtype=numpy.uint32)
+
+        for s in range(substrings):
+            column = values[:, s]
+            order[s] = numpy.argsort(column, kind='stable')
+            offsets[s, 1:] = numpy.cumsum(numpy.bincount(column, minlength=65536))
+
+        return cls(offsets, order)
+
+    def candidates(self, packed_hash: numpy.ndarray) -> numpy.ndarray:
+        """
+        Rows sharing at least one indexed substring with the packed hash
+
+        :param packed_hash: numpy.ndarray[uint64] shaped (words,)
+        :return: numpy.ndarray[uint32] of unique row indexes
+        """
+        values = packed_hash.view(numpy.uint16)
+
+        buckets = [
+            self.order[s, self.offsets[s, value]:self.offsets[s, value + 1]]
+            for s, value in enumerate(values[:len(self.order)].tolist())
+        ]
+
+        if not buckets:
+            return numpy.zeros(0, dtype=numpy.uint32)
+
+        return numpy.unique(numpy.concatenate(buckets))
+
+
+def _aligned(offset: int) -> int:
+    return offset + (-offset % SNAPSHOT_ALIGN)
 
 
 class HashTable:
-    rows: List[HashRow] = []
+    ids: numpy.ndarray
+    hashes: numpy.ndarray
+    index: MultiIndex
+    prefilter: Optional[numpy.ndarray]
+    created: float
+
+    def __init__(self, ids: numpy.ndarray, hashes: numpy.ndarray, index: MultiIndex = None, *,
+                 prefilter: numpy.ndarray = None, created: float = None):
+        """
+        Holds all phash as one packed uint64 matrix and ways to compare phash
+
+        :param ids: numpy.ndarray[bytes] of utf-8 Card ids, parallel to hashes
+        :param hashes: numpy.ndarray[uint64] shaped (rows, words)
+        :param index: Optional prebuilt MultiIndex over hashes
+        :param prefilter: Optional numpy.ndarray[uint64] shaped (rows,) of 64 bit prefilter phash, parallel to hashes
+        :param created: Timestamp of the data the table was built from
+        """
+        self.ids = ids
+        self.hashes = hashes
+        self.index = index if index is not None else MultiIndex.build(hashes, config.Config.hash_index_substrings)
+        self.prefilter = prefilter
+        self.created = created or time.time()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _key(self, row: int) -> str:
+        return self.ids[row].decode()
+
+    @classmethod
+    def from_db(cls, db: Session) -> 'HashTable':
+        """
+        Build a HashTable from every Card record with a phash
+
+        :param db: SqlAlchemy DB Session
+        :return: HashTable
+        """
+        ids = []
+        hashes = []
+        prefilter = []
+        size = None
+
+        for batch in Card.read_hash_batches(db):
+            size = size or len(batch[0][1])
+
+            # Hashes of a different size can not share the matrix
+            batch = [row for row in batch if len(row[1]) == size]
+            if not batch:
+                continue
+
+            ids.append(numpy.array([card_id.encode() for card_id, _, _ in batch], dtype=bytes))
+            hashes.append(pack_hashes([phash for _, phash, _ in batch]))
+
+            if prefilter is not None:
+                if any(phash_8 is None for _, _, phash_8 in batch):
+                    # Every row is needed to prefilter, until a Rehash fills in the missing ones
+                    logging.debug('HashTable prefilter disabled, some Cards have no phash_8')
+                    prefilter = None
+                else:
+                    prefilter.append(numpy.array([phash_8 for _, _, phash_8 in batch], dtype=numpy.int64))
+
+        if not ids:
+            return cls(ids=numpy.array([], dtype=bytes), hashes=pack_hashes([]))
+
+        return cls(
+            ids=numpy.concatenate(ids),
+            hashes=numpy.concatenate(hashes),
+            prefilter=numpy.concatenate(prefilter).view(numpy.uint64) if prefilter else None
+        )
+
+    @classmethod
+    def from_snapshot(cls, path: str) -> Optional['HashTable']:
+        """
+        Open a HashTable snapshot file. Arrays are memory-mapped, so only the header is read up front
+
+        :param path: Snapshot filename
+        :return: HashTable, or None when the snapshot is missing or unreadable
+        """
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'rb') as file:
+            try:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file
+                return None
+
+        if len(buffer) < SNAPSHOT_HEADER.size:
+            return None
+
+        magic, version, rows, words, id_width, substrings, has_prefilter, created = SNAPSHOT_HEADER.unpack_from(buffer)
+
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            logging.warning(f'Ignoring HashTable snapshot {path}: {magic} v{version}')
+            return None
+
+        sections = [
+            ('hashes', numpy.uint64, (rows, words)),
+            ('ids', numpy.dtype(f'S{id_width}'), (rows,)),
+            ('offsets', numpy.uint32, (substrings, 65537)),
+            ('order', numpy.uint32, (substrings, rows)),
+            ('prefilter', numpy.uint64, (rows if has_prefilter else 0,)),
+        ]
+
+        arrays = {}
+        offset = _aligned(SNAPSHOT_HEADER.size)
+        for name, dtype, shape in sections:
+            dtype = numpy.dtype(dtype)
+            count = int(numpy.prod(shape))
+
+            if offset + count * dtype.itemsize > len(buffer):
+                logging.warning(f'Ignoring truncated HashTable snapshot {path}')
+                return None
+
+            arrays[name] = numpy.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+            offset = _aligned(offset + count * dtype.itemsize)
+
+        return cls(
+            ids=arrays['ids'],
+            hashes=arrays['hashes'],
+            index=MultiIndex(arrays['offsets'], arrays['order']),
+            prefilter=arrays['prefilter'] if has_prefilter else None,
+            created=created
+        )
+
+    def save(self, path: str):
+        """
+        Write the HashTable to a snapshot file. Written to a temp file first and renamed, so readers never see a
+        partial snapshot and existing memory maps stay valid
+
+        :param path: Snapshot filename
+        """
+        rows, words = self.hashes.shape if self.hashes.size else (len(self), 0)
+        ids = self.ids.astype(bytes)
+        prefilter = self.prefilter if self.prefilter is not None else numpy.zeros(0, dtype=numpy.uint64)
+
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC,
+            SNAPSHOT_VERSION,
+            rows,
+            words,
+            ids.dtype.itemsize,
+            len(self.index.order),
+            self.prefilter is not None,
+            self.created
+        )
 
-    def __init__(self, db: Session):
+        # Unique temp file, Api and Rehash jobs may write a snapshot at the same time
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)),
+            prefix=f'{os.path.basename(path)}.',
+            suffix='.tmp'
+        )
+
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(header)
+
+                for array in (self.hashes, ids, self.index.offsets, self.index.order, prefilter):
+                    file.write(bytes(-file.tell() % SNAPSHOT_ALIGN))
+                    file.write(numpy.ascontiguousarray(array).tobytes())
+
+            # mkstemp creates the file owner-only
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        logging.debug(f'Saved HashTable snapshot {path}: {rows} rows')
+
+    @classmethod
+    def write_snapshot(cls, db: Session, path: str = None) -> 'HashTable':
+        """
+        Rebuild the HashTable from the DB and write its snapshot
+
+        :param db: SqlAlchemy DB Session
+        :param path: Snapshot filename, defaults to Config.hash_snapshot
+        :return: HashTable
+        """
+        hash_table = cls.from_db(db)
+        hash_table.save(path or config.Config.hash_snapshot)
+
+        return hash_table
+
+    @classmethod
+    def load(cls, db: Session, path: str = None) -> 'HashTable':
         """
-        Holds a List[HashRow] and ways to compare phash
+        Open the HashTable snapshot, rebuilding it when missing or older than the last completed Api or Rehash Job.
+        Must run before the Job table is truncated at startup
 
         :param db: SqlAlchemy DB Session
+        :param path: Snapshot filename, defaults to Config.hash_snapshot
+        :return: HashTable
         """
-        records: List[Card] = Card.read_all_hashes(db)
+        path = path or config.Config.hash_snapshot
+        hash_table = cls.from_snapshot(path)
+
+        if hash_table is not None:
+            # A job that completed but failed to write its snapshot leaves the snapshot stale
+            last_jobs = [Job.read_last_complete(db, job_type) for job_type in ('Api', 'Rehash')]
+            stale = [
+                job for job in last_jobs
+                if job and job.end_time and job.end_time.timestamp() > hash_table.created
+            ]
+
+            if stale:
+                logging.warning(f'HashTable snapshot is older than Job {stale[0].job_id}, rebuilding')
+                hash_table = None
+
+            elif len(hash_table.index.order) != min(config.Config.hash_index_substrings,
+                                                    hash_table.hashes.shape[1] * 4):
+                logging.debug('HashTable snapshot index does not match Config')
+                hash_table = None
+
+        if hash_table is None:
+            hash_table = cls.write_snapshot(db, path)
+
+        return hash_table
+
+    def _search(self, packed_hash: numpy.ndarray, radius: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Find every row within radius, using the MultiIndex when the radius is within its guarantee
+
+        :param packed_hash: numpy.ndarray[uint64] shaped (words,)
+        :param radius: Max hamming distance
+        :return: Tuple of (row indexes, distances)
+        """
+        if radius <= self.index.radius:
+            rows = self.index.candidates(packed_hash)
+            distances = hamming_distances(self.hashes[rows], packed_hash)
+        else:
+            rows = numpy.arange(len(self), dtype=numpy.uint32)
+            distances = hamming_distances(self.hashes, packed_hash)
+
+        within = distances <= radius
 
-        self.rows = [
-            HashRow(r.uuid, r.phash_32)
-            for r in records
+        return rows[within], distances[within]
+
+    def _cascade(self, packed_hash: numpy.ndarray, prefilter_hash: int,
+                 count: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Coarse to fine search: rank every row by its 64 bit prefilter distance (one XOR/popcount word per row), then
+        compare the full phash of only the closest Config.hash_prefilter_candidates rows
+
+        :param packed_hash: numpy.ndarray[uint64] shaped (words,)
+        :param prefilter_hash: Signed 64 bit prefilter phash
+        :param count: Number of rows needed
+        :return: Tuple of (row indexes, distances) of the candidates
+        """
+        candidates = max(count, config.Config.hash_prefilter_candidates)
+
+        coarse = hamming_distances(self.prefilter.reshape(-1, 1), pack_prefilter(prefilter_hash))
+        rows = numpy.argpartition(coarse, candidates - 1)[:candidates].astype(numpy.uint32)
+
+        return rows, hamming_distances(self.hashes[rows], packed_hash)
+
+    def _top(self, packed_hash: numpy.ndarray, count: int, prefilter_hash: int = None,
+             partial: bool = False) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Find the `count` nearest rows. Uses the MultiIndex candidates when enough are found within the index radius
+        (no row outside it can be closer, so the result is exact). Otherwise, falls back to the prefilter cascade when
+        a prefilter phash is available, or to a full scan. Selection is a partial argpartition, only the selected rows
+        are sorted.
+
+        :param packed_hash: numpy.ndarray[uint64] shaped (words,)
+        :param count: Number of rows to return
+        :param prefilter_hash: Optional signed 64 bit prefilter phash of the query
+        :param partial: Return the rows found within the index radius, even if fewer than `count`, instead of falling
+                        back. Every other row is further than the radius
+        :return: Tuple of (row indexes, distances) sorted by distance
+        """
+        count = min(count, len(self))
+        rows, distances = self._search(packed_hash, self.index.radius)
+        path = 'index'
+
+        INDEX_LOOKUPS.inc(result='hit' if len(rows) >= count else 'partial' if len(rows) else 'miss')
+
+        if len(rows) < count and not (partial and len(rows)):
+            if (prefilter_hash is not None and self.prefilter is not None and
+                    0 < config.Config.hash_prefilter_candidates < len(self)):
+                logging.debug(f'MultiIndex miss within {self.index.radius}, prefiltering {len(self)} rows')
+                rows, distances = self._cascade(packed_hash, prefilter_hash, count)
+                path = 'cascade'
+            else:
+                logging.debug(f'MultiIndex miss within {self.index.radius}, scanning {len(self)} rows')
+                rows = numpy.arange(len(self), dtype=numpy.uint32)
+                distances = hamming_distances(self.hashes, packed_hash)
+                path = 'scan'
+
+        LOOKUP_CANDIDATES.observe(len(rows), path=path)
+
+        if count < len(rows):
+            selected = numpy.argpartition(distances, count - 1)[:count]
+            rows, distances = rows[selected], distances[selected]
+
+        nearest = numpy.argsort(distances, kind='stable')[:count]
+
+        return rows[nearest], distances[nearest]
+
+    def get_matches_within(self, image_hash: imagehash.ImageHash, radius: int) -> List[Tuple[str, int]]:
+        """
+        Find every phash within a hamming distance radius
+
+        :param image_hash: ImageHash object
+        :param radius: Max hamming distance
+        :return: List of (Card id, hamming distance) sorted by distance
+        """
+        if not len(self):
+            return []
+
+        with LOOKUP_SECONDS.time(method='within'):
+            rows, distances = self._search(pack_hash(str(image_hash)), radius)
+
+        return [
+            (self._key(row), int(distance))
+            for distance, row in sorted(zip(distances.tolist(), rows.tolist()))
         ]
 
-    def get_closest_match(self, image_hash: imagehash.ImageHash) -> str:
+    def get_closest_match(self, image_hash: imagehash.ImageHash, prefilter_hash: int = None) -> Optional[str]:
         """
         Find the nearest neighbor phash using hamming distance
 
         :param image_hash: ImageHash object
-        :return: phash str as stored in DB Record
+        :param prefilter_hash: Optional signed 64 bit prefilter phash of the same image
+        :return: Card id of the closest phash
         """
+        if not len(self):
+            return None
+
         logging.debug(f'Calculating Hamming Diffs {image_hash}')
         t = time.time() if logging.root.level == logging.DEBUG else 0
 
-        hamming_diffs = {
-            row.uuid: row.image_hash - image_hash
-            for row in self.rows
-        }
+        with LOOKUP_SECONDS.time(method='closest'):
+            rows, distances = self._top(pack_hash(str(image_hash)), 1, prefilter_hash)
 
-        closest_key = min(hamming_diffs, key=hamming_diffs.get)
-        closest_val = min(hamming_diffs.values())
+        closest_key = self._key(rows[0])
+        closest_val = int(distances[0])
 
         logging.debug(f'Calculated Hamming Diffs Complete {time.time() - t} key:{closest_key} val:{closest_val}')
 
         return closest_key
+
+    def get_top_matches(self, image_hash: imagehash.ImageHash, k: int = None,
+                        prefilter_hash: int = None) -> MatchResults:
+        """
+        Find the k nearest neighbor phash, with the margin between the best and second best distance.
+        Confidence is the margin relative to the second best distance (0 when tied, 1 for an exact unique match)
+
+        Unrelated cards are far outside the MultiIndex radius, so usually only the best match is found within it.
+        Fewer than k matches are then returned, and the second best distance is only known to be more than the
+        radius: runner_up, margin and confidence are lower bounds, and exact is False
+
+        :param image_hash: ImageHash object
+        :param k: Number of matches to return, defaults to Config.match_top_k
+        :param prefilter_hash: Optional signed 64 bit prefilter phash of the same image
+        :return: MatchResults
+        """
+        k = k or config.Config.match_top_k
+
+        if not len(self):
+            return MatchResults(matches=[])
+
+        t = time.time() if logging.root.level == logging.DEBUG else 0
+
+        # At least two are needed for the margin
+        with LOOKUP_SECONDS.time(method='top'):
+            rows, distances = self._top(pack_hash(str(image_hash)), max(k, 2), prefilter_hash, partial=True)
+
+        distances = distances.tolist()
+
+        runner_up = None
+        exact = True
+        if len(distances) > 1:
+            runner_up = distances[1]
+        elif len(self) > 1:
+            # Every other row is outside the radius
+            runner_up = self.index.radius + 1
+            exact = False
+
+        margin = None
+        confidence = None
+        if runner_up is not None:
+            margin = runner_up - distances[0]
+            confidence = margin / runner_up if runner_up else 0.0
+
+        results = MatchResults(
+            matches=[
+                HashMatch(id=self._key(row), distance=distance)
+                for row, distance in zip(rows[:k].tolist(), distances[:k])
+            ],
+            margin=margin,
+            confidence=confidence,
+            runner_up=runner_up,
+            exact=exact
+        )
+
+        logging.debug(f'Calculated Top {k} Matches {time.time() - t} margin:{margin} matches:{results.matches}')
+
+        return results
+
+
+class Recognizer:
+    # Replaced as a whole, never mutated; readers take one reference per request and need no lock
+    hash_table: Optional[HashTable] = None
+
+    @classmethod
+    def load(cls, db: Session):
+        """
+        Load the HashTable kept resident for recognition requests
+
+        :param db: SqlAlchemy DB Session
+        """
+        cls.hash_table = HashTable.load(db)
+
+        logging.debug(f'Recognizer loaded {len(cls.hash_table)} hashes')
+
+    @classmethod
+    def reload(cls, path: str = None):
+        """
+        Map in a freshly written HashTable snapshot and swap it in. In-flight requests keep the table they started
+        with; its memory map is released once they finish
+
+        :param path: Snapshot filename, defaults to Config.hash_snapshot
+        """
+        if cls.hash_table is None:
+            # Recognition is not in use in this process
+            return
+
+        hash_table = HashTable.from_snapshot(path or config.Config.hash_snapshot)
+
+        if hash_table is None:
+            logging.warning('Recognizer reload skipped, no readable HashTable snapshot')
+            return
+
+        cls.hash_table = hash_table
+
+        logging.debug(f'Recognizer reloaded {len(hash_table)} hashes')
+
+    @classmethod
+    def recognize(cls, image_bytes: bytes, k: int = None) -> Optional[MatchResults]:
+        """
+        Hash an encoded image (jpeg/png) and find its closest Cards
+
+        :param image_bytes: Encoded image bytes
+        :param k: Number of matches to return, defaults to Config.match_top_k
+        :return: MatchResults, or None if the image could not be read
+        """
+        hash_table = cls.hash_table
+
+        image = Image(io.BytesIO(image_bytes))
+        image_hash = image.image_hash()
+
+        if not image_hash:
+            return None
+
+        return hash_table.get_top_matches(image_hash, k, image.prefilter_hash())
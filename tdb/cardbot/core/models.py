@@ -1,18 +1,20 @@
 import os
 from pathlib import Path
 
-from sqlalchemy import Boolean, Column, Integer, String, DateTime
+import requests
+from sqlalchemy import BigInteger, Boolean, Column, Integer, String, DateTime
 from sqlalchemy.dialects.postgresql import JSON
 
 from tdb.cardbot.core import config
 from tdb.cardbot.core.database import Database
-from tdb.cardbot.core.image import Image
 from tdb.cardbot.core.utils import download_file
 
 
 class Card(Database.base):
     __tablename__ = 'cards'
 
+    # JSON columns store None as SQL NULL (not the JSON value null), so upsert_many can tell missing values apart
+
     id = Column(String, primary_key=True, index=True)
     object_type = Column(String, index=True)
 
@@ -35,9 +37,9 @@ class Card(Database.base):
     rarity = Column(String)
     collector_number = Column(String)
 
-    colors = Column(JSON)
-    color_identity = Column(JSON)
-    color_indicator = Column(JSON)
+    colors = Column(JSON(none_as_null=True))
+    color_identity = Column(JSON(none_as_null=True))
+    color_indicator = Column(JSON(none_as_null=True))
 
     mana_cost = Column(String)
     cmc = Column(String)
@@ -48,10 +50,10 @@ class Card(Database.base):
 
     border_color = Column(String, index=True)
     frame = Column(String)
-    frame_effects = Column(JSON)
+    frame_effects = Column(JSON(none_as_null=True))
     layout = Column(String)
 
-    keywords = Column(JSON)
+    keywords = Column(JSON(none_as_null=True))
 
     image_url = Column(String)
     image_local = Column(String)
@@ -64,7 +66,7 @@ class Card(Database.base):
     cardmarket_id = Column(String)
     tcgplayer_id = Column(String)
 
-    legalities = Column(JSON)
+    legalities = Column(JSON(none_as_null=True))
 
     reserved = Column(Boolean)
     reprint = Column(Boolean)
@@ -85,43 +87,44 @@ class Card(Database.base):
     watermark = Column(String)
     security_stamp = Column(String)
 
-    prices = Column(JSON)
+    prices = Column(JSON(none_as_null=True))
 
     phash_32 = Column(String)
+    phash_8 = Column(BigInteger)
+
+    digest = Column(String)
 
-    cardkingdom_buylist_foil = Column(JSON)
-    cardkingdom_buylist_normal = Column(JSON)
-    cardkingdom_retail_foil = Column(JSON)
-    cardkingdom_retail_normal = Column(JSON)
+    cardkingdom_buylist_foil = Column(JSON(none_as_null=True))
+    cardkingdom_buylist_normal = Column(JSON(none_as_null=True))
+    cardkingdom_retail_foil = Column(JSON(none_as_null=True))
+    cardkingdom_retail_normal = Column(JSON(none_as_null=True))
 
-    cardmarket_retail_foil = Column(JSON)
-    cardmarket_retail_normal = Column(JSON)
+    cardmarket_retail_foil = Column(JSON(none_as_null=True))
+    cardmarket_retail_normal = Column(JSON(none_as_null=True))
 
-    tcgplayer_buylist_foil = Column(JSON)
-    tcgplayer_buylist_normal = Column(JSON)
-    tcgplayer_retail_foil = Column(JSON)
-    tcgplayer_retail_normal = Column(JSON)
+    tcgplayer_buylist_foil = Column(JSON(none_as_null=True))
+    tcgplayer_buylist_normal = Column(JSON(none_as_null=True))
+    tcgplayer_retail_foil = Column(JSON(none_as_null=True))
+    tcgplayer_retail_normal = Column(JSON(none_as_null=True))
 
-    def download_image(self):
+    @staticmethod
+    def download_image_file(image_url: str, image_local: str, *, session: requests.Session = None) -> bool:
         """
-        Download image from Scryfall Api
+        Download image from Scryfall Api if it is missing
+
+        :param image_url: Scryfall image url
+        :param image_local: Image path relative to Config.image_path
+        :param session: Optional requests Session used for the download
+        :return: True if the image was downloaded
         """
-        if not self.image_url:
-            return
-
-        filepath = Path(config.Config.image_path, self.image_local)
-        filename = str(filepath)
-
-        new_hash = False
-        if not os.path.exists(filename):
-            download_file(url=self.image_url, filename=filename)
-            new_hash = True
-
-        if new_hash or not self.phash_32:
-            image = Image(filepath)
-            phash = image.image_hash()
-            if phash:
-                self.phash_32 = str(phash)
+        filename = str(Path(config.Config.image_path, image_local))
+
+        if os.path.exists(filename):
+            return False
+
+        download_file(url=image_url, filename=filename, session=session)
+
+        return True
 
 
 class Job(Database.base):
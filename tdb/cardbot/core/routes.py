@@ -1,15 +1,19 @@
 import datetime
 from http import HTTPStatus
-from typing import Union
+from typing import Union, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from starlette.exceptions import HTTPException
+from starlette.requests import Request
 
 from tdb.cardbot.core.api import Api
+from tdb.cardbot.core.api.images import Rehash
 from tdb.cardbot.core.crud.job import Job
 from tdb.cardbot.core.database import Database
-from tdb.cardbot.core.schemas import JobDetails
+from tdb.cardbot.core.hashing import MAX_TOP_K, Recognizer
+from tdb.cardbot.core.schemas import JobDetails, MatchResults
 from tdb.cardbot.routes import BaseRoutes
 
 
@@ -26,6 +30,16 @@ class Routes(BaseRoutes):
         """
         return await Api.run()
 
+    @staticmethod
+    @router.get('/database/rehash', status_code=HTTPStatus.ACCEPTED, response_model=JobDetails)
+    async def database_rehash() -> JobDetails:
+        """
+        Rebuild the phash of every downloaded Card image
+
+        :return: JobDetails
+        """
+        return await Rehash.run()
+
     @staticmethod
     @router.get('/job/{key}', response_model=JobDetails)
     async def get_job(key: Union[int, str], db: Session = Depends(Database.get_db)) -> JobDetails:
@@ -65,3 +79,26 @@ class Routes(BaseRoutes):
         db.refresh(job)
 
         return job
+
+    @staticmethod
+    @router.post('/recognize', response_model=MatchResults)
+    async def recognize(request: Request, k: Optional[int] = Query(None, ge=1, le=MAX_TOP_K)) -> MatchResults:
+        """
+        Identify the Card in an image; request body is the jpeg bytes as returned by the node /capture route
+
+        :param request: Request with the image as its body
+        :param k: Number of matches to return (1 to MAX_TOP_K), defaults to Config.match_top_k
+        :return: MatchResults
+        """
+        if Recognizer.hash_table is None:
+            raise HTTPException(status_code=503, detail="Recognizer not loaded")
+
+        image_bytes = await request.body()
+
+        # Hashing is CPU bound, keep it off the event loop
+        results = await run_in_threadpool(Recognizer.recognize, image_bytes, k)
+
+        if not results:
+            raise HTTPException(status_code=400, detail="Unable to read image")
+
+        return results
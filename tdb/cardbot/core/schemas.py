@@ -1,5 +1,5 @@
 import datetime
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -97,6 +97,8 @@ class NewCard(BaseSchema):
     tcgplayer_retail_foil: Optional[dict]
     tcgplayer_retail_normal: Optional[dict]
 
+    digest: Optional[str]
+
     class Config:
         orm_mode = True
 
@@ -111,6 +113,7 @@ class NewCard(BaseSchema):
 
 class CardFull(NewCard):
     phash_32: Optional[str]
+    phash_8: Optional[int]
 
     def price_schema(self):
         data = {}
@@ -127,3 +130,16 @@ class JobDetails(BaseSchema):
 
     class Config:
         orm_mode = True
+
+
+class HashMatch(BaseSchema):
+    id: str
+    distance: int
+
+
+class MatchResults(BaseSchema):
+    matches: List[HashMatch]
+    margin: Optional[int]
+    confidence: Optional[float]
+    runner_up: Optional[int]
+    exact: bool = True
@@ -1,25 +1,62 @@
+import hashlib
 import json
 import logging
 import lzma
 import os
+import pickle
+import re
 import tempfile
+import time
 from pathlib import Path
-from typing import TextIO, Union
+from typing import TextIO, Union, BinaryIO, Iterator, Any, Tuple, Optional, Iterable, Callable
 
 import requests
 
+# Size of each read while streaming JSON from a file
+JSON_CHUNK_SIZE = 1048576
 
-def download_file(url: str, *, filename: str = None) -> Union[dict, list]:
+# Seconds between download attempts, multiplied by the attempt number
+DOWNLOAD_RETRY_DELAY = 5
+
+# Number of items pickled together in a parsed cache stream
+PARSED_BATCH_SIZE = 1000
+
+
+def _save_response(request: requests.Response, file: BinaryIO, filename: str) -> int:
+    """
+    Stream a response body into an open file
+
+    :param request: Streaming requests Response
+    :param file: Open binary file to write to
+    :param filename: Name used in logging
+    :return: Number of bytes saved
+    """
+    size: int = int(request.headers.get('Content-Length', 0))
+
+    saved = 0
+    # Chunk file and provide details as received
+    for chunk in request.iter_content(chunk_size=1048576):
+        if chunk:
+            file.write(chunk)
+            saved += len(chunk)
+            logging.debug(f'Downloading "{filename}": {round((saved / size) * 100, 2) if size else saved}%')
+
+    logging.debug(f'Downloaded "{filename}": {max(saved, size)}b')
+
+    return saved
+
+
+def download_file(url: str, *, filename: str = None, session: requests.Session = None) -> Union[dict, list]:
     """
     Download file from url
 
     :param url: URL to download from
     :param filename: Optional filename to save download to. If not provided a TemporaryFile will be used.
+    :param session: Optional requests Session, reuses its pooled keep-alive connections
     :return: Dict with details on the downloaded file. If the file is serializable; its internal data will be returned.
              Otherwise, information on the downloaded file's location will be returned.
     """
-    request = requests.get(url, allow_redirects=True, stream=True)
-    size: int = int(request.headers.get('Content-Length', 0))
+    request = (session or requests).get(url, allow_redirects=True, stream=True)
 
     if filename:
         # Open filename location for streaming
@@ -35,14 +72,8 @@ def download_file(url: str, *, filename: str = None) -> Union[dict, list]:
         'filename': filename
     }
 
-    saved = 0
     with streamer as file:
-        # Chunk file and provide details as received
-        for chunk in request.iter_content(chunk_size=1048576):
-            if chunk:
-                file.write(chunk)
-                saved += len(chunk)
-                logging.debug(f'Downloading "{filename}": {round((saved / size) * 100, 2) if size else saved}%')
+        _save_response(request, file, filename)
 
         if filename.lower().split('.')[-1] == 'xz':
             # Decompress LZMA/LZMA2 json file
@@ -54,11 +85,291 @@ def download_file(url: str, *, filename: str = None) -> Union[dict, list]:
             file.seek(0)
             data = json.load(file)
 
-    logging.debug(f'Downloaded "{filename}": {max(saved, size)}b')
-
     return data
 
 
+def _sidecar_path(path: Path) -> Path:
+    """
+    Path of the details stored next to a cached download
+
+    :param path: Cached download path
+    :return: Sidecar path
+    """
+    return path.with_name(f'{path.name}.json')
+
+
+def _read_sidecar(path: Path) -> dict:
+    """
+    Read the details stored next to a cached download
+
+    :param path: Sidecar path
+    :return: dict of url, etag, last_modified, version and size. Empty if missing or unreadable.
+    """
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_sidecar(path: Path, details: dict):
+    """
+    Write the details of a cached download next to it
+
+    :param path: Sidecar path
+    :param details: dict of url, etag, last_modified, version and size
+    """
+    temp = path.with_name(f'{path.name}.tmp')
+    with open(temp, 'w') as file:
+        json.dump(details, file)
+
+    os.replace(temp, path)
+
+
+def _validators(response: requests.Response) -> dict:
+    """
+    Cache validators of a response
+
+    :param response: requests Response
+    :return: dict of etag and last_modified
+    """
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified')
+    }
+
+
+def _download_part(url: str, part: Path, part_sidecar: Path, headers: dict) -> Optional[dict]:
+    """
+    Download url into a .part file, resuming a previous partial transfer with a Range request when the server
+    still reports the same validators
+
+    :param url: URL to download from
+    :param part: Partial download path
+    :param part_sidecar: Validators of the partial download
+    :param headers: Conditional request headers
+    :return: Validators and size of the completed download, or None if the cached copy is not modified
+    """
+    headers = dict(headers)
+    validators = _read_sidecar(part_sidecar)
+    offset = part.stat().st_size if part.exists() else 0
+
+    # Resume only if the partial download can be validated against the current file
+    if offset and (validators.get('etag') or validators.get('last_modified')):
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = validators.get('etag') or validators.get('last_modified')
+
+    with requests.get(url, allow_redirects=True, stream=True, headers=headers, timeout=60) as response:
+        if response.status_code == 304:
+            return None
+
+        if response.status_code == 416:
+            # Partial download is no longer valid, restart it on the next attempt
+            part.unlink(missing_ok=True)
+            part_sidecar.unlink(missing_ok=True)
+            raise IOError(f'Unable to resume "{url}"')
+
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            logging.debug(f'Resuming "{url}" at {offset}b')
+            mode = 'ab'
+            size = int(response.headers.get('Content-Range', '*/0').split('/')[-1] or 0)
+        else:
+            offset = 0
+            mode = 'wb'
+            size = int(response.headers.get('Content-Length', 0))
+            _write_sidecar(part_sidecar, _validators(response))
+
+        with open(part, mode) as file:
+            saved = offset + _save_response(response, file, url.split('/')[-1])
+
+        details = _validators(response) if response.status_code != 206 else validators
+
+    # Compressed transfers do not report the decoded size
+    if size and response.headers.get('Content-Encoding') in (None, 'identity') and saved != size:
+        raise IOError(f'Incomplete download "{url}": {saved}b of {size}b')
+
+    return dict(details, size=saved)
+
+
+def download_cached(url: str, cache_path: Union[str, Path], *, version: str = None, retries: int = 3) -> Path:
+    """
+    Download file from url into a cache directory keyed by URL.
+
+    An unchanged upstream `version` (Scryfall bulk updated_at, MTGJson meta version) is served from the cache without
+    any request. Otherwise a conditional request (ETag/Last-Modified) is made, and interrupted transfers are resumed
+    with HTTP Range requests. The downloaded size is verified before the cached file is replaced.
+
+    :param url: URL to download from
+    :param cache_path: Cache directory
+    :param version: Optional upstream version of the file
+    :param retries: Number of attempts before giving up, at least one is made
+    :return: Path to the cached file
+    """
+    retries = max(1, retries)
+    cache_path = Path(cache_path)
+    os.makedirs(cache_path, exist_ok=True)
+
+    key = hashlib.sha1(url.encode()).hexdigest()[:16]
+    path = cache_path / f'{key}-{url.split("/")[-1].split("?")[0]}'
+    sidecar = _sidecar_path(path)
+    part = path.with_name(f'{path.name}.part')
+    part_sidecar = path.with_name(f'{part.name}.json')
+
+    details = _read_sidecar(sidecar)
+    cached = details.get('url') == url and path.exists() and path.stat().st_size == details.get('size')
+
+    if cached and version and details.get('version') == version:
+        logging.debug(f'Using cached "{url}" version {version}')
+        return path
+
+    headers = {}
+    if cached and details.get('etag'):
+        headers['If-None-Match'] = details['etag']
+    if cached and details.get('last_modified'):
+        headers['If-Modified-Since'] = details['last_modified']
+
+    for attempt in range(1, retries + 1):
+        try:
+            result = _download_part(url, part, part_sidecar, headers)
+            break
+
+        except (requests.RequestException, IOError) as e:
+            if attempt == retries:
+                raise
+
+            logging.warning(f'Download "{url}" failed ({attempt}/{retries}): {e}')
+            time.sleep(DOWNLOAD_RETRY_DELAY * attempt)
+
+    if result is None:
+        logging.debug(f'Using cached "{url}": not modified')
+        details['version'] = version
+    else:
+        os.replace(part, path)
+        part_sidecar.unlink(missing_ok=True)
+        details = dict(result, url=url, version=version)
+
+    _write_sidecar(sidecar, details)
+
+    return path
+
+
+def parsed_cache_path(path: Path, name: str) -> Optional[Path]:
+    """
+    Location of a parsed cache derived from a cached download. The cache is keyed by the upstream version (or
+    validators) of the download, so a new upstream file always misses. Parsed caches of older versions are removed.
+
+    :param path: Cached download path returned by download_cached()
+    :param name: Name of the parsed result, include any options that change it
+    :return: Parsed cache path, or None if the download has no version or validators
+    """
+    details = _read_sidecar(_sidecar_path(path))
+    version = details.get('version') or details.get('etag') or details.get('last_modified')
+
+    if not version:
+        return None
+
+    key = hashlib.sha1(f'{version}:{details.get("size")}'.encode()).hexdigest()[:16]
+    cache = path.with_name(f'{path.name}.{name}-{key}.pickle')
+
+    for stale in path.parent.glob(f'{path.name}.{name}-*.pickle'):
+        if stale != cache:
+            stale.unlink(missing_ok=True)
+
+    return cache
+
+
+def load_parsed(cache: Optional[Path]) -> Optional[Any]:
+    """
+    Load a parsed cache
+
+    :param cache: Parsed cache path
+    :return: Cached value, or None if missing or unreadable
+    """
+    if not cache or not cache.exists():
+        return None
+
+    try:
+        with open(cache, 'rb') as file:
+            return pickle.load(file)
+
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+        logging.warning(f'Unable to load parsed cache "{cache}": {e}')
+        return None
+
+
+def save_parsed(cache: Optional[Path], value: Any) -> Any:
+    """
+    Save a parsed cache
+
+    :param cache: Parsed cache path, nothing is saved if None
+    :param value: Value to cache
+    :return: value
+    """
+    if cache:
+        temp = cache.with_name(f'{cache.name}.tmp')
+        with open(temp, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temp, cache)
+
+    return value
+
+
+def iter_parsed(cache: Optional[Path], items: Iterable[Any], *,
+                progress: Callable[[int, int], None] = None) -> Iterator[Any]:
+    """
+    Stream items through a parsed cache. A complete cache is read back in pickled batches; otherwise items are
+    consumed and written to the cache as they are yielded, and the cache is only kept if every item was consumed.
+
+    :param cache: Parsed cache path, items are passed through if None
+    :param items: Iterable of items, only consumed on a cache miss
+    :param progress: Called with (bytes read, cache size) after each batch read back from the cache
+    :return: Iterator of items
+    """
+    if not cache:
+        yield from items
+        return
+
+    if cache.exists():
+        logging.debug(f'Using parsed cache "{cache}"')
+
+        with open(cache, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+
+            while True:
+                try:
+                    batch = pickle.load(file)
+                except EOFError:
+                    return
+
+                if progress:
+                    progress(file.tell(), size)
+
+                yield from batch
+
+    temp = cache.with_name(f'{cache.name}.tmp')
+    try:
+        with open(temp, 'wb') as file:
+            batch = []
+            for item in items:
+                batch.append(item)
+                yield item
+
+                if len(batch) >= PARSED_BATCH_SIZE:
+                    pickle.dump(batch, file, protocol=pickle.HIGHEST_PROTOCOL)
+                    batch = []
+
+            pickle.dump(batch, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temp, cache)
+
+    finally:
+        temp.unlink(missing_ok=True)
+
+
 def decompress_json(file: TextIO):
     """
     Decompress a JSON file stored as LZMA/LZMA2
@@ -69,3 +380,201 @@ def decompress_json(file: TextIO):
         data = json.load(lzma_file)
 
     return data
+
+
+class _JsonReader:
+    _decoder = json.JSONDecoder()
+    _whitespace = ' \t\n\r'
+    _delimiters = ' \t\n\r,:]}'
+
+    # Complete strings (skipped as a whole), brackets, or an opening quote of a string cut off by the buffer end
+    _skip_tokens = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]"]')
+
+    def __init__(self, file: TextIO, chunk_size: int = JSON_CHUNK_SIZE):
+        """
+        Buffered reader to decode JSON values one at a time from a text file
+
+        :param file: Text file to read from
+        :param chunk_size: Size of each read
+        """
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size: int = None) -> bool:
+        """
+        Read more of the file into the buffer, dropping everything already consumed
+
+        :param size: Size to read, defaults to chunk_size
+        :return: False once the file is exhausted
+        """
+        chunk = self.file.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+        return True
+
+    def peek(self) -> str:
+        """
+        Skip whitespace and return the next character without consuming it
+
+        :return: Next character, or '' at end of file
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self._whitespace:
+                self.pos += 1
+
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str):
+        """
+        Consume the next character, which must be `char`
+
+        :param char: Expected character
+        """
+        found = self.peek()
+        if found != char:
+            raise ValueError(f'Invalid JSON: expected "{char}" found "{found}"')
+
+        self.pos += 1
+
+    def decode(self) -> Any:
+        """
+        Decode the next complete JSON value
+
+        :return: Decoded value
+        """
+        self.peek()
+
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+
+                # A number could continue past the end of the buffer, so the value must be followed by a delimiter
+                if self.eof or (end < len(self.buffer) and self.buffer[end] in self._delimiters):
+                    self.pos = end
+                    return value
+
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+
+            # Grow reads with the value size, so long values are not re-decoded too often
+            self._fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+    def skip(self):
+        """
+        Consume the next JSON value without decoding it. Objects and arrays are scanned for their matching bracket,
+        so skipped subtrees are never materialized
+        """
+        if self.peek() not in ('{', '['):
+            self.decode()
+            return
+
+        depth = 0
+        while True:
+            resume = len(self.buffer)
+
+            for match in self._skip_tokens.finditer(self.buffer, self.pos):
+                token = match.group()
+
+                if token == '"':
+                    # String continues past the buffer, rescan it after the next read
+                    resume = match.start()
+                    break
+
+                if token[0] == '"':
+                    continue
+
+                depth += 1 if token in '{[' else -1
+                if not depth:
+                    self.pos = match.end()
+                    return
+
+            self.pos = resume
+
+            if not self._fill(max(self.chunk_size, len(self.buffer) - self.pos)):
+                raise ValueError('Invalid JSON: unexpected end of file')
+
+    def items(self, paths: Tuple[tuple, ...], keys: tuple = ()) -> Iterator[Tuple[tuple, Any]]:
+        """
+        Walk the next JSON value, decoding only the values found at the end of a path and skipping everything else
+
+        :param paths: Paths remaining below this value
+        :param keys: Keys leading to this value
+        :return: Iterator of (keys, value)
+        """
+        if any(not path for path in paths):
+            yield keys, self.decode()
+            return
+
+        char = self.peek()
+        if char not in ('{', '['):
+            self.skip()
+            return
+
+        is_object = char == '{'
+        close = '}' if is_object else ']'
+        self.pos += 1
+
+        index = 0
+        while True:
+            char = self.peek()
+
+            if char == close:
+                self.pos += 1
+                return
+
+            if char == ',':
+                self.pos += 1
+                continue
+
+            if not char:
+                raise ValueError('Invalid JSON: unexpected end of file')
+
+            if is_object:
+                key = self.decode()
+                self.expect(':')
+            else:
+                key = index
+                index += 1
+
+            matched = tuple(
+                path[1:]
+                for path in paths
+                if path[0] is None or path[0] == key
+            )
+
+            if matched:
+                yield from self.items(matched, keys + (key,))
+            else:
+                self.skip()
+
+
+def iter_json(file: TextIO, *paths: Tuple[Optional[Union[str, int]], ...],
+              chunk_size: int = JSON_CHUNK_SIZE) -> Iterator[Tuple[tuple, Any]]:
+    """
+    Stream a JSON file, decoding only the values at the given paths one at a time, in file order.
+    Path items are object keys or array indexes; None matches every key/index at that level.
+
+    Example: iter_json(file, ('meta',), ('data', None, 'cards', None)) yields
+             (('meta',), {...}) then (('data', 'SET', 'cards', 0), {...card...}) for every card of every set
+
+    :param file: Text file containing JSON
+    :param paths: Paths of the values to decode
+    :param chunk_size: Size of each read
+    :return: Iterator of (keys, value)
+    """
+    reader = _JsonReader(file, chunk_size)
+
+    yield from reader.items(paths)
@@ -1,5 +1,45 @@
 import concurrent.futures
-from typing import Callable, List
+import queue
+import threading
+from typing import Any, Callable, List
+
+
+def queue_put(target: queue.Queue, item: Any, stop: threading.Event, alive: Callable[[], bool] = None) -> bool:
+    """
+    Put an item on a bounded queue, waiting while it is full
+
+    :param target: Queue to put on
+    :param item: Item, or None to end the reading thread
+    :param stop: Event set when the job is stopping
+    :param alive: Optional check that the reader is still running, e.g. Process.is_alive
+    :return: False if the job stopped, or the reader exited, before the item was queued
+    """
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=1)
+            return True
+        except queue.Full:
+            if alive and not alive():
+                return False
+
+    return False
+
+
+def queue_get(source: queue.Queue, stop: threading.Event) -> Any:
+    """
+    Wait for the next queued item
+
+    :param source: Queue to get from
+    :param stop: Event set when the job is stopping
+    :return: Item, or None when there are no more items or the job is stopping
+    """
+    while not stop.is_set():
+        try:
+            return source.get(timeout=1)
+        except queue.Empty:
+            continue
+
+    return None
 
 
 class Thread:
@@ -0,0 +1,236 @@
+import bisect
+import contextlib
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Tuple
+
+# Prometheus client default buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Starlette appends the charset to text responses
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def _escape(value: str, quotes: bool = True) -> str:
+    value = str(value).replace('\\', r'\\').replace('\n', r'\n')
+
+    return value.replace('"', r'\"') if quotes else value
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+
+    return repr(float(value))
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+    return f'{{{labels}}}' if labels else ''
+
+
+class Metric(ABC):
+    metric_type: str
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        """
+        Metric registered with the Registry, holding one value per label combination
+
+        :param name: Metric name
+        :param documentation: HELP text
+        :param labelnames: Label names, every update passes a value for each
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+        Registry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def _samples(self) -> List[Tuple[str, Tuple[str, ...], Tuple[str, ...], float]]:
+        """
+        :return: List of (sample name, label names, label values, value)
+        """
+        pass
+
+    def render(self) -> str:
+        """
+        Prometheus text format of the metric
+
+        :return: HELP, TYPE and sample lines
+        """
+        lines = [
+            f'# HELP {self.name} {_escape(self.documentation, quotes=False)}',
+            f'# TYPE {self.name} {self.metric_type}'
+        ]
+        lines += [
+            f'{name}{_format_labels(names, values)} {_format_value(value)}'
+            for name, names, values, value in self._samples()
+        ]
+
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Increase the counter
+
+        :param amount: Non-negative amount
+        :param labels: Label values
+        """
+        if amount < 0:
+            raise ValueError(f'{self.name} can only increase')
+
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [(f'{self.name}_total', self.labelnames, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    metric_type = 'gauge'
+
+    def set(self, value: float, **labels):
+        """
+        Set the gauge
+
+        :param value: Current value
+        :param labels: Label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Change the gauge
+
+        :param amount: Amount to add, negative to decrease
+        :param labels: Label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, self.labelnames, key, value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Histogram of observed values, with cumulative bucket counts, a sum and a count
+
+        :param name: Metric name
+        :param documentation: HELP text
+        :param labelnames: Label names, every observation passes a value for each
+        :param buckets: Sorted bucket upper bounds, +Inf is added
+        """
+        self.buckets = tuple(sorted(buckets))
+        if not self.buckets or self.buckets[-1] != math.inf:
+            self.buckets += (math.inf,)
+
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, **labels):
+        """
+        Record an observation
+
+        :param value: Observed value
+        :param labels: Label values
+        """
+        key = self._key(labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bucket] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """
+        Observe the seconds spent in the enclosed block
+
+        :param labels: Label values
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        samples = []
+        bucket_labels = self.labelnames + ('le',)
+
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append((f'{self.name}_bucket', bucket_labels, key + (_format_value(bound),), cumulative))
+
+                samples.append((f'{self.name}_sum', self.labelnames, key, total))
+                samples.append((f'{self.name}_count', self.labelnames, key, cumulative))
+
+        return samples
+
+
+class Registry:
+    _metrics: Dict[str, Metric] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def register(cls, metric: Metric):
+        """
+        Add a metric to the /metrics output
+
+        :param metric: Metric, names must be unique
+        """
+        with cls._lock:
+            if metric.name in cls._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+
+            cls._metrics[metric.name] = metric
+
+    @classmethod
+    def render(cls) -> str:
+        """
+        Prometheus text format of every registered metric
+
+        :return: /metrics response body
+        """
+        with cls._lock:
+            metrics = list(cls._metrics.values())
+
+        return ''.join(f'{metric.render()}\n' for metric in metrics)
+
+
+REQUEST_SECONDS = Histogram(
+    'cardbot_http_request_duration_seconds',
+    'HTTP request latency by route',
+    ('method', 'route', 'status')
+)
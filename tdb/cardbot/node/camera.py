@@ -5,6 +5,14 @@ import time
 
 import picamera
 
+from tdb.cardbot import metrics
+
+CAPTURE_SECONDS = metrics.Histogram(
+    'cardbot_camera_capture_duration_seconds',
+    'PiCamera still capture duration',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
 
 class PiCameraDriver:
     camera: picamera.PiCamera
@@ -39,7 +47,8 @@ class PiCameraDriver:
     @classmethod
     def capture(cls):
         logging.debug(f'Capturing Image')
-        cls.camera.capture(cls.stream, 'jpeg', use_video_port=False)
+        with CAPTURE_SECONDS.time():
+            cls.camera.capture(cls.stream, 'jpeg', use_video_port=False)
 
         # return current frame
         cls.stream.seek(0)
@@ -4,6 +4,7 @@ import time
 from enum import Enum
 from typing import Optional, List
 
+from tdb.cardbot import metrics
 from tdb.cardbot.futures import Thread, ThreadPool
 
 try:
@@ -16,6 +17,13 @@ except ImportError:
 
 GPIO.setmode(GPIO.BCM)
 
+STEP_SECONDS = metrics.Histogram(
+    'cardbot_stepper_step_duration_seconds',
+    'Stepper move duration by axis',
+    ('axis',),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+
 
 class Direction(Enum):
     POSITIVE = 1
@@ -94,7 +102,7 @@ class Stepper(Motor):
     def step(self, steps: int = None, home: bool = False) -> int:
         if not self.lock.locked():
 
-            with self.lock:
+            with self.lock, STEP_SECONDS.time(axis=self.name):
                 if not steps or home:
                     steps = self.default_steps
 
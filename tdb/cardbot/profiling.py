@@ -0,0 +1,193 @@
+import collections
+import contextlib
+import datetime
+import logging
+import os
+import random
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+
+from tdb.cardbot import config
+
+
+class Sampler:
+    def __init__(self, interval: float):
+        """
+        Sampling profiler. A background thread records the stack of every other thread every `interval` seconds, so
+        the profiled code runs unmodified and work spread over thread pools is included
+
+        :param interval: Seconds between samples
+        """
+        self.interval = interval
+        self.stacks: Dict[str, int] = collections.Counter()
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample_thread, name='ProfileSampler', daemon=True)
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+    def _sample_thread(self):
+        own = threading.get_ident()
+
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+
+                stack = []
+                while frame:
+                    stack.append(self._frame_name(frame))
+                    frame = frame.f_back
+
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self) -> 'Sampler':
+        self._thread.start()
+        return self
+
+    def stop(self) -> Dict[str, int]:
+        """
+        Stop sampling
+
+        :return: Sample count keyed by folded stack (thread;outer;...;inner)
+        """
+        self._stop.set()
+        self._thread.join()
+
+        return self.stacks
+
+
+class Profiler:
+    directory: Path = Path('profiles')
+    interval: float = 0.005
+    job: Optional[str] = None
+    rate: float = 0.0
+
+    # One profile at a time, overlapping samplers would record each other's work
+    _lock = threading.Lock()
+
+    @classmethod
+    def load(cls, app_config: Type[config.BaseConfig]):
+        """
+        Read the profile settings of the application config
+
+        :param app_config: Loaded application Config
+        """
+        cls.directory = Path(app_config.profile_dir)
+        cls.interval = app_config.profile_interval
+        cls.job = app_config.profile_job
+        cls.rate = app_config.profile_rate
+
+    @classmethod
+    def sample_request(cls) -> bool:
+        """
+        :return: True for Config.profile_rate of requests
+        """
+        return random.random() < cls.rate
+
+    @classmethod
+    def take_job(cls, job_type: str) -> bool:
+        """
+        Check if a job run should be profiled; Config.profile_job is profiled once
+
+        :param job_type: JobPool class name
+        :return: True if this run should be profiled
+        """
+        if cls.job != job_type:
+            return False
+
+        cls.job = None
+        return True
+
+    @classmethod
+    @contextlib.contextmanager
+    def profile(cls, name: str):
+        """
+        Sample the enclosed block and write the folded stacks (flamegraph.pl / speedscope input) to Config.profile_dir.
+        Skipped if another profile is running
+
+        :param name: Profile name, used in the filename
+        """
+        if not cls._lock.acquire(False):
+            yield
+            return
+
+        try:
+            sampler = Sampler(cls.interval).start()
+            try:
+                yield
+            finally:
+                cls._write(name, sampler.stop())
+
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def _write(cls, name: str, stacks: Dict[str, int]) -> Optional[Path]:
+        """
+        Write folded stacks to the profile directory
+
+        :param name: Profile name
+        :param stacks: Sample count keyed by folded stack
+        :return: Profile path, or None if it could not be written
+        """
+        name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')
+        path = cls.directory / f'{datetime.datetime.now():%Y%m%d-%H%M%S-%f}-{name}.folded'
+
+        try:
+            os.makedirs(cls.directory, exist_ok=True)
+
+            with open(path, 'w') as file:
+                for stack, count in sorted(stacks.items()):
+                    file.write(f'{stack} {count}\n')
+
+        except OSError as e:
+            logging.warning(f'Unable to write profile "{path}": {e}')
+            return None
+
+        logging.debug(f'Wrote profile "{path}" ({sum(stacks.values())} samples)')
+
+        return path
+
+    @classmethod
+    def list_profiles(cls) -> List[dict]:
+        """
+        :return: List of profile details, newest first
+        """
+        if not cls.directory.is_dir():
+            return []
+
+        profiles = [
+            {
+                'name': path.name,
+                'size': path.stat().st_size,
+                'modified': datetime.datetime.fromtimestamp(path.stat().st_mtime)
+            }
+            for path in cls.directory.glob('*.folded')
+        ]
+
+        return sorted(profiles, key=lambda profile: profile['modified'], reverse=True)
+
+    @classmethod
+    def profile_path(cls, name: str) -> Optional[Path]:
+        """
+        Path of a listed profile; names with a directory part are rejected
+
+        :param name: Profile filename
+        :return: Path, or None if there is no such profile
+        """
+        if name != os.path.basename(name) or not name.endswith('.folded'):
+            return None
+
+        path = cls.directory / name
+
+        return path if path.is_file() else None
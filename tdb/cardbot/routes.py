@@ -1,7 +1,12 @@
-from fastapi import APIRouter
-from starlette.responses import RedirectResponse
+from typing import List
+
+from fastapi import APIRouter, HTTPException
+from starlette.responses import FileResponse, RedirectResponse, Response
 from starlette.templating import Jinja2Templates
 
+from tdb.cardbot import metrics
+from tdb.cardbot.profiling import Profiler
+
 
 class BaseRoutes:
     router = APIRouter()
@@ -12,3 +17,22 @@ class BaseRoutes:
     @router.get('/')
     async def docs_redirect():
         return RedirectResponse(url='/docs')
+
+    @staticmethod
+    @router.get('/metrics')
+    async def read_metrics():
+        return Response(metrics.Registry.render(), media_type=metrics.CONTENT_TYPE)
+
+    @staticmethod
+    @router.get('/profiles')
+    async def list_profiles() -> List[dict]:
+        return Profiler.list_profiles()
+
+    @staticmethod
+    @router.get('/profiles/{name}')
+    async def get_profile(name: str):
+        path = Profiler.profile_path(name)
+        if not path:
+            raise HTTPException(status_code=404, detail=f'Profile {name} not found')
+
+        return FileResponse(path, media_type='text/plain', filename=name)
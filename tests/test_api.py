@@ -0,0 +1,95 @@
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from tdb.cardbot.core import config
+from tdb.cardbot.core.api import SHARD_BATCH_SIZE, Api, _ShardStats
+from tdb.cardbot.core.api.stats import JobStats
+from tdb.cardbot.core.schemas import NewCard
+
+
+def test_shard_stats_sends_records(monkeypatch):
+    monkeypatch.setattr(config.Config, 'stats_interval', 0.05)
+    results_queue = queue.Queue()
+    stats = _ShardStats(results_queue)
+
+    # Held until the interval has passed
+    stats.add_records('ApiShard-0', 3)
+    assert results_queue.empty()
+
+    time.sleep(0.06)
+    stats.add_records('ApiShard-0')
+    assert results_queue.get_nowait() == ('records', 'ApiShard-0', 4)
+
+    # The rest is sent when the shard finishes
+    stats.add_records('ApiShard-0', 2)
+    stats.send_records()
+    assert results_queue.get_nowait() == ('records', 'ApiShard-0', 2)
+
+    assert stats.snapshot()['records'] == 6
+
+
+def test_collect_results_counts_running_shards():
+    results_queue = queue.Queue()
+    for item in [
+        ('records', 'ApiShard-0', 200),
+        ('records', 'ApiShard-1', 100),
+        ('results', 1, {'written': 100}),
+        ('records', 'ApiShard-0', 50),
+        ('results', 0, {'written': 250})
+    ]:
+        results_queue.put(item)
+
+    stats = JobStats()
+    processes = [SimpleNamespace(is_alive=lambda: True)] * 2
+
+    shard_results = Api._collect_results_thread(results_queue, processes, stats)
+
+    assert shard_results == {'0': {'written': 250}, '1': {'written': 100}}
+    workers = stats.snapshot()['workers']
+    assert {worker: details['records'] for worker, details in workers.items()} == {'ApiShard-0': 250, 'ApiShard-1': 100}
+
+
+def test_collect_results_stops_without_shards():
+    stats = JobStats()
+    processes = [SimpleNamespace(is_alive=lambda: False)]
+
+    assert Api._collect_results_thread(queue.Queue(), processes, stats) == {}
+
+
+def test_dispatch_cards_stops_on_dead_shard(monkeypatch):
+    cards = [{'id': str(number), 'set': 'one'} for number in range(SHARD_BATCH_SIZE * 3)]
+    monkeypatch.setattr(Api, '_read_cards', classmethod(lambda cls, scryfall_file, stats: (card for card in cards)))
+
+    # The shard exited with its queue full, nothing will ever read it
+    card_queue = queue.Queue(maxsize=1)
+    card_queue.put([])
+    stop = threading.Event()
+    processes = [SimpleNamespace(is_alive=lambda: False)]
+
+    results = Api._dispatch_cards_thread(None, [card_queue], processes, stop, JobStats())
+
+    assert stop.is_set()
+    assert results == {'0': {'queued': SHARD_BATCH_SIZE, 'sets': 1}}
+    assert card_queue.qsize() == 1
+
+
+@pytest.mark.parametrize('card_data', [
+    # Only the required keys, every other column is None
+    {'id': 'a', 'object_type': 'card'},
+    # Float cmc and numeric ids become strings
+    {'id': 'b', 'object_type': 'card', 'cmc': 3.0, 'mtgo_id': 12345, 'tcgplayer_id': 7, 'cardmarket_id': 0},
+    {'id': 'c', 'object_type': 'card', 'cmc': 0.5, 'power': 2, 'collector_number': 101},
+    # String and int booleans
+    {'id': 'd', 'object_type': 'card', 'reserved': 'true', 'reprint': 'no', 'variation': 1},
+    {'id': 'e', 'object_type': 'card', 'reserved': 0, 'reprint': 'Yes', 'variation': 'f', 'foil': 'on'},
+    {'id': 'f', 'object_type': 'card', 'reserved': None, 'reprint': False, 'variation': True},
+    # Unknown keys are dropped, JSON columns are kept as is
+    {'id': 'g', 'object_type': 'card', 'object': 'card', 'uri': 'https://example.com', 'games': ['paper'],
+     'legalities': {'modern': 'legal'}, 'colors': ['G'], 'prices': {'usd': '0.10', 'eur': None}}
+])
+def test_map_card_matches_new_card(card_data):
+    assert Api._map_card(card_data) == NewCard(**card_data).dict()
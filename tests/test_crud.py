@@ -0,0 +1,71 @@
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert
+
+from tdb.cardbot.core import models
+from tdb.cardbot.core.crud.card import Card
+
+
+def _card(card_id: str, **columns) -> dict:
+    return {'id': card_id, 'object_type': 'card', 'legalities': None, 'prices': None, **columns}
+
+
+def test_json_none_binds_sql_null():
+    statement = insert(models.Card.__table__).values([_card('a')]).compile(dialect=postgresql.psycopg2.dialect())
+    processors = statement._bind_processors
+
+    params = {
+        name: processors[name](value) if name in processors else value
+        for name, value in statement.construct_params().items()
+    }
+
+    assert params['prices_m0'] is None
+    assert params['legalities_m0'] is None
+
+
+def _read(db, card_id: str, column: str):
+    return db.execute(text(f'SELECT {column}::jsonb FROM cards WHERE id = :id'), {'id': card_id}).scalar()
+
+
+def test_upsert_merge_round_trip(postgres):
+    # Repeated upserts without data keep SQL NULL, instead of growing a JSON array
+    for _ in range(3):
+        Card.upsert_many(postgres, [_card('face')], commit=False)
+
+    assert _read(postgres, 'face', 'prices') is None
+    assert postgres.execute(text("SELECT prices IS NULL FROM cards WHERE id = 'face'")).scalar()
+
+    # Dicts are merged, and a later write without data keeps the stored dict
+    Card.upsert_many(postgres, [_card('card', prices={'a': 1})], commit=False)
+    Card.upsert_many(postgres, [_card('card', prices={'b': 2})], commit=False)
+    Card.upsert_many(postgres, [_card('card')], commit=False)
+
+    assert _read(postgres, 'card', 'prices') == {'a': 1, 'b': 2}
+
+    # Values left by the old merge (arrays, JSON null) are replaced by the next dict
+    postgres.execute(text("UPDATE cards SET prices = '[{\"a\": 1}, null]', legalities = 'null' WHERE id = 'card'"))
+    Card.upsert_many(postgres, [_card('card', prices={'c': 3}, legalities={'modern': 'legal'})], commit=False)
+
+    assert _read(postgres, 'card', 'prices') == {'c': 3}
+    assert _read(postgres, 'card', 'legalities') == {'modern': 'legal'}
+
+
+def test_read_digests_waits_for_every_face(postgres):
+    face = {'scryfall_id': 'dfc', 'digest': 'd1', 'image_url': 'https://example.com/face.png'}
+
+    Card.upsert_many(postgres, [
+        # Double faced card: the main row has no image, the faces do
+        _card('dfc', scryfall_id='dfc', digest='d1', image_url=None),
+        _card('dfc-Front', **face, phash_32='ab', phash_8=1),
+        _card('dfc-Back', **face),
+        # Single faced card with both hashes
+        _card('single', scryfall_id='single', digest='d2', image_url='https://example.com/single.png',
+              phash_32='cd', phash_8=2),
+    ], commit=False)
+
+    # The back face is not hashed yet, so the card is not skipped
+    assert Card.read_digests(postgres) == {'single': 'd2'}
+
+    Card.update_hashes(postgres, {'dfc-Back': ('ef', 3)}, commit=False)
+
+    assert Card.read_digests(postgres) == {'dfc': 'd1', 'single': 'd2'}
@@ -0,0 +1,128 @@
+import http.server
+import threading
+from pathlib import Path
+
+import pytest
+import requests
+
+from tdb.cardbot.core import utils
+
+CONTENT = bytes(range(256)) * 12288
+ETAG = '"v1"'
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # Bytes of the next full response to send before dropping the connection, per request
+    truncate = []
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = CONTENT
+        byte_range = self.headers.get('Range')
+
+        if byte_range and self.headers.get('If-Range') == ETAG:
+            start = int(byte_range.split('=')[1].rstrip('-'))
+            if start >= len(CONTENT):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(CONTENT)}')
+                self.end_headers()
+                return
+
+            body = CONTENT[start:]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}')
+        else:
+            self.send_response(200)
+
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        sent = self.truncate.pop(0) if self.truncate else len(body)
+        self.wfile.write(body[:sent])
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(utils, 'DOWNLOAD_RETRY_DELAY', 0)
+    monkeypatch.setattr(_Handler, 'truncate', [])
+    monkeypatch.setattr(_Handler, 'requests', [])
+
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    yield f'http://127.0.0.1:{httpd.server_address[1]}/AllPrices.json.xz'
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _part(path: Path) -> Path:
+    return path.with_name(f'{path.name}.part')
+
+
+def test_download_cached_reuse(server, tmp_path):
+    path = utils.download_cached(server, tmp_path, version='1')
+
+    assert path.read_bytes() == CONTENT
+    assert len(_Handler.requests) == 1
+
+    # Same upstream version, served from the cache without a request
+    assert utils.download_cached(server, tmp_path, version='1') == path
+    assert len(_Handler.requests) == 1
+
+    # New version, the conditional request is answered 304 Not Modified
+    assert utils.download_cached(server, tmp_path, version='2') == path
+    assert _Handler.requests[-1]['If-None-Match'] == ETAG
+    assert path.read_bytes() == CONTENT
+    assert not _part(path).exists()
+
+
+def test_download_cached_resumes(server, tmp_path):
+    # The first transfer is cut off, the retry resumes it with a Range request
+    _Handler.truncate = [2097152]
+
+    path = utils.download_cached(server, tmp_path, retries=2)
+
+    assert path.read_bytes() == CONTENT
+    assert _Handler.requests[1]['Range'] == 'bytes=2097152-'
+    assert _Handler.requests[1]['If-Range'] == ETAG
+    assert not _part(path).exists()
+    assert not _part(path).with_name(f'{_part(path).name}.json').exists()
+
+
+def test_download_cached_restarts_invalid_part(server, tmp_path):
+    path = utils.download_cached(server, tmp_path)
+    path.unlink()
+
+    # A partial download longer than the file is answered 416, and restarted from the start
+    _part(path).write_bytes(CONTENT + b'extra')
+    utils._write_sidecar(_part(path).with_name(f'{_part(path).name}.json'), {'etag': ETAG})
+
+    assert utils.download_cached(server, tmp_path).read_bytes() == CONTENT
+    assert 'Range' in _Handler.requests[-2]
+    assert 'Range' not in _Handler.requests[-1]
+
+
+def test_download_cached_gives_up(server, tmp_path):
+    _Handler.truncate = [10, 10]
+
+    with pytest.raises((requests.RequestException, IOError)):
+        utils.download_cached(server, tmp_path, retries=2)
+
+    assert len(_Handler.requests) == 2
+
+    # At least one attempt is made
+    _Handler.truncate = []
+    assert utils.download_cached(server, tmp_path, retries=0).read_bytes() == CONTENT
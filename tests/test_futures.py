@@ -0,0 +1,59 @@
+import contextlib
+import queue
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from tdb.cardbot.core import futures
+from tdb.cardbot.core.futures import JobPool
+from tdb.cardbot.core.schemas import JobDetails
+from tdb.cardbot.futures import queue_put
+
+
+class _FailingJob(JobPool):
+    _lock = threading.Lock()
+
+    @classmethod
+    def _run(cls, details: JobDetails):
+        raise RuntimeError('failed')
+
+
+def test_start_releases_lock_on_failure():
+    _FailingJob._lock.acquire()
+
+    with pytest.raises(RuntimeError):
+        _FailingJob._start(JobDetails(job_id=1, job_type='_FailingJob'), False)
+
+    assert not _FailingJob._lock.locked()
+
+
+@pytest.mark.parametrize('status, refreshed', [('running', True), ('stopped', False)])
+def test_complete_logs_snapshot_failure(monkeypatch, status, refreshed):
+    job = SimpleNamespace(status=status, results=None, end_time=None)
+    db = SimpleNamespace(commit=lambda: None)
+    attempts = []
+
+    def write_snapshot(db):
+        attempts.append(db)
+        raise OSError('disk full')
+
+    monkeypatch.setattr(futures.Database, 'db_contextmanager', contextlib.contextmanager(lambda: (yield db)))
+    monkeypatch.setattr(futures.Job, 'read_one', classmethod(lambda cls, db, job_id: job))
+    monkeypatch.setattr(futures.HashTable, 'write_snapshot', classmethod(lambda cls, db: write_snapshot(db)))
+
+    # The snapshot failure is logged, the Job is still completed
+    _FailingJob._complete(JobDetails(job_id=1, job_type='_FailingJob'), {'written': 1})
+
+    assert job.status == ('complete' if refreshed else status)
+    assert job.results == {'written': 1}
+    assert job.end_time is not None
+    assert attempts == ([db] if refreshed else [])
+
+
+def test_queue_put_gives_up_on_dead_reader():
+    target = queue.Queue(maxsize=1)
+    target.put(0)
+
+    assert not queue_put(target, 1, threading.Event(), alive=lambda: False)
+    assert target.get_nowait() == 0
@@ -0,0 +1,160 @@
+import datetime
+import threading
+import time
+from types import SimpleNamespace
+from typing import List, Tuple
+
+import imagehash
+import numpy
+import pytest
+
+from tdb.cardbot.core import config
+from tdb.cardbot.core.crud.job import Job
+from tdb.cardbot.core.hashing import LOOKUP_CANDIDATES, HashTable, MultiIndex, pack_hashes
+
+
+def _hash_table(rows: int = 200, seed: int = 0) -> Tuple[HashTable, List[str]]:
+    rng = numpy.random.default_rng(seed)
+    hashes = [str(imagehash.ImageHash(rng.integers(0, 2, size=(48, 48)).astype(bool))) for _ in range(rows)]
+    packed = pack_hashes(hashes)
+
+    return HashTable(
+        ids=numpy.array([f'card-{row}'.encode() for row in range(rows)]),
+        hashes=packed,
+        prefilter=rng.integers(0, 2 ** 63, size=rows, dtype=numpy.int64).view(numpy.uint64)
+    ), hashes
+
+
+def test_snapshot_round_trip(tmp_path):
+    hash_table, hashes = _hash_table()
+    path = str(tmp_path / 'hash_table.snapshot')
+
+    hash_table.save(path)
+    loaded = HashTable.from_snapshot(path)
+
+    assert loaded.created == hash_table.created
+    assert loaded.ids.tolist() == hash_table.ids.tolist()
+    numpy.testing.assert_array_equal(loaded.hashes, hash_table.hashes)
+    numpy.testing.assert_array_equal(loaded.index.offsets, hash_table.index.offsets)
+    numpy.testing.assert_array_equal(loaded.index.order, hash_table.index.order)
+    numpy.testing.assert_array_equal(loaded.prefilter, hash_table.prefilter)
+
+    assert loaded.get_closest_match(imagehash.hex_to_hash(hashes[7])) == 'card-7'
+
+    # Only the snapshot is left, no temp files
+    assert [file.name for file in tmp_path.iterdir()] == ['hash_table.snapshot']
+
+
+def test_snapshot_concurrent_saves(tmp_path):
+    path = str(tmp_path / 'hash_table.snapshot')
+    tables = [_hash_table(rows=2000, seed=seed)[0] for seed in range(4)]
+
+    threads = [threading.Thread(target=hash_table.save, args=(path,)) for hash_table in tables]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Whichever save finished last, the snapshot is complete
+    loaded = HashTable.from_snapshot(path)
+    assert any(numpy.array_equal(loaded.hashes, hash_table.hashes) for hash_table in tables)
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_load_rebuilds_stale_snapshot(tmp_path, monkeypatch):
+    hash_table, _ = _hash_table()
+    path = str(tmp_path / 'hash_table.snapshot')
+    hash_table.save(path)
+
+    rebuilt = []
+    monkeypatch.setattr(HashTable, 'write_snapshot', classmethod(lambda cls, db, path=None: rebuilt.append(path)))
+
+    # No completed jobs since the snapshot
+    monkeypatch.setattr(Job, 'read_last_complete', classmethod(lambda cls, db, job_type: None))
+    assert HashTable.load(None, path) is not None
+    assert not rebuilt
+
+    # A Rehash completed after the snapshot was written
+    finished = SimpleNamespace(job_id=3, end_time=datetime.datetime.fromtimestamp(time.time() + 60))
+    monkeypatch.setattr(
+        Job, 'read_last_complete', classmethod(lambda cls, db, job_type: finished if job_type == 'Rehash' else None)
+    )
+    HashTable.load(None, path)
+    assert rebuilt == [path]
+
+
+def _capture(hash_table: HashTable, row: int, bits: int) -> imagehash.ImageHash:
+    """
+    Copy of a row with `bits` indexed substrings changed by one bit each, like a capture of the card
+    """
+    rng = numpy.random.default_rng(row)
+    unpacked = numpy.unpackbits(hash_table.hashes[row].view(numpy.uint8))
+    for substring in rng.choice(len(hash_table.index.order), size=bits, replace=False):
+        unpacked[substring * 16 + rng.integers(16)] ^= 1
+
+    return imagehash.hex_to_hash(numpy.packbits(unpacked).tobytes().hex())
+
+
+def test_index_radius_covers_captures():
+    hash_table, hashes = _hash_table(rows=500)
+
+    # Every substring of the 48x48 phash is indexed by default
+    assert hash_table.index.radius == 143
+
+    # A capture of a card differs by about 60-120 bits; 24 of the substrings are left unchanged
+    query = _capture(hash_table, 42, 120)
+
+    assert imagehash.hex_to_hash(hashes[42]) - query == 120
+    assert 42 in hash_table.index.candidates(pack_hashes([str(query)])[0])
+    assert hash_table.get_closest_match(query) == 'card-42'
+
+
+def _index_lookups() -> int:
+    counts, _ = LOOKUP_CANDIDATES._values.get(('index',), ([0], 0.0))
+    return sum(counts)
+
+
+def test_top_matches_stay_on_index(monkeypatch):
+    hash_table, _ = _hash_table(rows=500)
+    query = _capture(hash_table, 7, 100)
+
+    # Unrelated rows are about 1150 bits away, outside the radius; neither fallback may run
+    monkeypatch.setattr(config.Config, 'hash_prefilter_candidates', 10)
+    monkeypatch.setattr(HashTable, '_cascade', lambda *args: pytest.fail('cascade'))
+    index_lookups = _index_lookups()
+
+    matches = hash_table.get_top_matches(query, 5, prefilter_hash=0)
+
+    assert [(match.id, match.distance) for match in matches.matches] == [('card-7', 100)]
+    assert matches.runner_up == 144
+    assert matches.margin == 44
+    assert matches.confidence == 44 / 144
+    assert not matches.exact
+    assert _index_lookups() == index_lookups + 1
+
+    # Close rows are all found within the radius and the margin is exact
+    hash_table.hashes = hash_table.hashes.copy()
+    hash_table.hashes[8] = pack_hashes([str(_capture(hash_table, 7, 10))])[0]
+    hash_table.index = MultiIndex.build(hash_table.hashes, 144)
+
+    matches = hash_table.get_top_matches(query, 5, prefilter_hash=0)
+
+    assert [match.id for match in matches.matches] == ['card-7', 'card-8']
+    assert matches.runner_up == matches.matches[1].distance
+    assert matches.exact
+
+
+def test_load_keeps_empty_snapshot(tmp_path, monkeypatch):
+    path = str(tmp_path / 'hash_table.snapshot')
+    HashTable(ids=numpy.array([], dtype=bytes), hashes=pack_hashes([])).save(path)
+
+    rebuilt = []
+    monkeypatch.setattr(HashTable, 'write_snapshot', classmethod(lambda cls, db, path=None: rebuilt.append(path)))
+    monkeypatch.setattr(Job, 'read_last_complete', classmethod(lambda cls, db, job_type: None))
+
+    # An empty table is a valid snapshot, not a missing one
+    hash_table = HashTable.load(None, path)
+
+    assert hash_table is not None and len(hash_table) == 0
+    assert not rebuilt
+    assert hash_table.get_top_matches(imagehash.hex_to_hash('0' * 16)).matches == []
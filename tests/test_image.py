@@ -0,0 +1,102 @@
+import io
+
+import numpy
+import pytest
+from PIL import Image as PillowImage
+
+from tdb.cardbot.core.image import Image, hash_image
+
+
+def _card_png(seed: int) -> bytes:
+    """
+    Random card sized (488x680) RGBA png, with transparent corners like a Scryfall png
+    """
+    rng = numpy.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(680, 488, 4), dtype=numpy.uint8)
+    pixels[:20, :20, 3] = 0
+
+    file = io.BytesIO()
+    PillowImage.fromarray(pixels).save(file, 'PNG')
+
+    return file.getvalue()
+
+
+@pytest.mark.parametrize('fast', [False, True])
+def test_image_hash(fast):
+    image = Image(io.BytesIO(_card_png(0)), fast=fast)
+
+    assert len(str(image.image_hash())) == 48 * 48 // 4
+    assert image.prefilter_hash() is not None
+
+
+def test_hash_image(tmp_path):
+    path = tmp_path / 'card.png'
+    path.write_bytes(_card_png(1))
+
+    phash, phash_8 = hash_image(str(path))
+
+    assert phash == str(Image(str(path)).image_hash())
+    assert isinstance(phash_8, int)
+
+
+def _smooth_png(rng: numpy.random.Generator) -> io.BytesIO:
+    """
+    Smooth (upscaled) random card sized png, like a real scan
+    """
+    image = PillowImage.fromarray(rng.integers(0, 256, size=(68, 49, 3), dtype=numpy.uint8))
+
+    file = io.BytesIO()
+    image.resize((488, 680), PillowImage.BICUBIC).save(file, 'PNG')
+    file.seek(0)
+
+    return file
+
+
+@pytest.mark.parametrize('hash_size', [8, 48])
+def test_image_hashes_parity(hash_size):
+    rng = numpy.random.default_rng(hash_size)
+    images = [Image(_smooth_png(rng)) for _ in range(32)]
+
+    # An image that is not loaded keeps its place as None
+    images.append(Image(io.BytesIO(b'not an image')))
+
+    batch = [str(image_hash) if image_hash else None for image_hash in Image.image_hashes(images, hash_size)]
+    single = [str(image.image_hash(hash_size)) if image.pillow_image else None for image in images]
+
+    assert batch == single
+    assert batch[-1] is None
+
+
+def _z_transform_reference(pixels: numpy.ndarray) -> numpy.ndarray:
+    """
+    The PIL getdata/percentile/putdata z_transform the stored phashes were built with
+    """
+    image = PillowImage.fromarray(pixels)
+    data = image.getdata()
+    quantiles = numpy.arange(100)
+    quantiles_values = numpy.percentile(data, quantiles)
+    image.putdata((numpy.interp(data, quantiles_values, quantiles) / 100 * 255).astype(numpy.uint8))
+
+    return numpy.asarray(image)
+
+
+def _z_transform_inputs() -> list:
+    rng = numpy.random.default_rng(18)
+
+    return [
+        rng.integers(0, 256, size=(192, 192), dtype=numpy.uint8),
+        rng.integers(0, 256, size=(32, 32), dtype=numpy.uint8),
+        rng.normal(128, 40, size=(192, 192)).clip(0, 255).astype(numpy.uint8),
+        numpy.full((192, 192), 0, dtype=numpy.uint8),
+        numpy.full((64, 64), 137, dtype=numpy.uint8),
+        numpy.full((64, 64), 255, dtype=numpy.uint8),
+        rng.integers(100, 103, size=(192, 192), dtype=numpy.uint8),
+        rng.choice(numpy.array([0, 255], dtype=numpy.uint8), size=(50, 50)),
+        numpy.array([[0, 1], [254, 255]], dtype=numpy.uint8),
+        numpy.array([[7]], dtype=numpy.uint8)
+    ]
+
+
+@pytest.mark.parametrize('pixels', _z_transform_inputs())
+def test_z_transform_matches_reference(pixels):
+    numpy.testing.assert_array_equal(Image.z_transform(pixels), _z_transform_reference(pixels))
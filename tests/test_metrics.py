@@ -0,0 +1,60 @@
+import pytest
+
+from tdb.cardbot import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # Metrics of the application modules are left out of the rendered output
+    monkeypatch.setattr(metrics.Registry, '_metrics', {})
+    return metrics.Registry
+
+
+def test_metric_is_abstract():
+    with pytest.raises(TypeError):
+        metrics.Metric('cardbot_test_abstract', 'Abstract metric')
+
+
+def test_render_counter_and_gauge(registry):
+    counter = metrics.Counter('cardbot_test_records', 'Records "processed"\nby result', ('result',))
+    gauge = metrics.Gauge('cardbot_test_queued', 'Queued records')
+
+    counter.inc(result='written')
+    counter.inc(2.5, result='written')
+    counter.inc(result='a "quoted" \\ value\n')
+    gauge.set(4)
+    gauge.inc(-1)
+
+    assert registry.render() == (
+        '# HELP cardbot_test_records Records "processed"\\nby result\n'
+        '# TYPE cardbot_test_records counter\n'
+        'cardbot_test_records_total{result="written"} 3.5\n'
+        'cardbot_test_records_total{result="a \\"quoted\\" \\\\ value\\n"} 1.0\n'
+        '# HELP cardbot_test_queued Queued records\n'
+        '# TYPE cardbot_test_queued gauge\n'
+        'cardbot_test_queued 3.0\n'
+    )
+
+    with pytest.raises(ValueError):
+        counter.inc(-1, result='written')
+    with pytest.raises(ValueError):
+        counter.inc(path='written')
+    with pytest.raises(ValueError):
+        metrics.Gauge('cardbot_test_queued', 'Registered twice')
+
+
+def test_render_histogram(registry):
+    histogram = metrics.Histogram('cardbot_test_seconds', 'Lookup latency', ('method',), buckets=(0.5, 0.1))
+
+    for value in (0.05, 0.1, 0.3, 7):
+        histogram.observe(value, method='top')
+
+    assert registry.render() == (
+        '# HELP cardbot_test_seconds Lookup latency\n'
+        '# TYPE cardbot_test_seconds histogram\n'
+        'cardbot_test_seconds_bucket{method="top",le="0.1"} 2.0\n'
+        'cardbot_test_seconds_bucket{method="top",le="0.5"} 3.0\n'
+        'cardbot_test_seconds_bucket{method="top",le="+Inf"} 4.0\n'
+        'cardbot_test_seconds_sum{method="top"} 7.45\n'
+        'cardbot_test_seconds_count{method="top"} 4.0\n'
+    )
@@ -0,0 +1,94 @@
+import json
+import lzma
+import uuid
+
+import pytest
+
+from tdb.cardbot.core import config
+from tdb.cardbot.core.api.mtgjson import IdentifierMap, MTGJson
+
+
+def _uuid(number: int) -> str:
+    return str(uuid.UUID(int=number))
+
+
+def test_identifier_map():
+    # Trailing null bytes are stripped by numpy, so include ids ending in zeros
+    pairs = [(_uuid(number), _uuid(number + 2 ** 64)) for number in (256, 1, 2 ** 127, 3, 0)]
+    identifiers = IdentifierMap(pairs)
+
+    assert len(identifiers) == len(pairs)
+
+    for scryfall_id, mtgjson_uuid in pairs:
+        assert identifiers.get(scryfall_id) == mtgjson_uuid
+        assert identifiers.get(scryfall_id.upper()) == mtgjson_uuid
+
+    assert identifiers.get(_uuid(2)) is None
+    assert identifiers.get(_uuid(2), 'default') == 'default'
+    assert identifiers.get('not a uuid', 'default') == 'default'
+    assert identifiers.get(None) is None
+
+
+def test_identifier_map_invalid_and_duplicates():
+    identifiers = IdentifierMap([
+        (_uuid(1), _uuid(10)),
+        ('not a uuid', _uuid(11)),
+        (_uuid(2), None),
+        (_uuid(1), _uuid(12)),
+        (_uuid(1), _uuid(13))
+    ])
+
+    assert len(identifiers) == 3
+    assert identifiers.get(_uuid(2)) is None
+
+    # The last duplicate wins, as with a dict
+    assert identifiers.get(_uuid(1)) == _uuid(13)
+
+
+def test_identifier_map_empty():
+    identifiers = IdentifierMap([])
+
+    assert len(identifiers) == 0
+    assert identifiers.get(_uuid(1)) is None
+
+
+def test_trim_prices():
+    paper = {
+        'tcgplayer': {
+            'currency': 'USD',
+            'retail': {'normal': {'2024-01-03': 3, '2024-01-01': 1, '2024-01-02': 2}, 'foil': {'2024-01-01': 9}}
+        },
+        'cardmarket': {'buylist': {'normal': {f'2024-02-{day:02}': day for day in range(1, 11)}}}
+    }
+
+    trimmed = MTGJson._trim_prices(paper, 2)
+
+    assert trimmed['tcgplayer'] == {
+        'currency': 'USD',
+        'retail': {'normal': {'2024-01-02': 2, '2024-01-03': 3}, 'foil': {'2024-01-01': 9}}
+    }
+    assert trimmed['cardmarket']['buylist']['normal'] == {'2024-02-09': 9, '2024-02-10': 10}
+
+
+@pytest.mark.parametrize('days', [0, 1])
+def test_download_prices_paper_only(tmp_path, monkeypatch, days):
+    path = tmp_path / 'AllPrices.json.xz'
+    with lzma.open(path, mode='wt') as file:
+        json.dump({
+            'meta': {'version': '5.2.2'},
+            'data': {
+                'uuid-1': {
+                    'mtgo': {'cardhoarder': {'retail': {'normal': {'2024-01-01': 0.02}}}},
+                    'paper': {'tcgplayer': {'retail': {'normal': {'2024-01-01': 1.5, '2024-01-02': 2.5}}}}
+                },
+                'uuid-2': {'mtgo': {'cardhoarder': {'retail': {'foil': {'2024-01-01': 0.5}}}}}
+            }
+        }, file)
+
+    monkeypatch.setattr(MTGJson, '_download', classmethod(lambda cls, filename: path))
+    monkeypatch.setattr(config.Config, 'price_days', days)
+
+    normal = {'2024-01-02': 2.5} if days else {'2024-01-01': 1.5, '2024-01-02': 2.5}
+
+    # Cards without paper pricing are left out
+    assert MTGJson.download_prices() == {'uuid-1': {'tcgplayer': {'retail': {'normal': normal}}}}
@@ -0,0 +1,26 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from tdb.cardbot.core.hashing import MAX_TOP_K, Recognizer
+from tdb.cardbot.core.routes import Routes
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(Recognizer, 'hash_table', None)
+
+    app = FastAPI()
+    app.include_router(Routes.router)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize('k', [0, -1, MAX_TOP_K + 1, 'all'])
+def test_recognize_rejects_k(client, k):
+    assert client.post('/recognize', params={'k': k}, content=b'').status_code == 422
+
+
+@pytest.mark.parametrize('params', [{}, {'k': 1}, {'k': MAX_TOP_K}])
+def test_recognize_accepts_k(client, params):
+    # Valid k reaches the handler, which has no hash table loaded
+    assert client.post('/recognize', params=params, content=b'').status_code == 503
@@ -0,0 +1,102 @@
+import io
+import json
+
+import pytest
+
+from tdb.cardbot.core import utils
+
+CARDS = [
+    {'id': 'a', 'name': 'Fire // Ice', 'oracle_text': 'Deal 2 damage. {R}', 'cmc': 4.0, 'prices': {'usd': None}},
+    {'id': 'b', 'name': 'Say "Hi" \\ [x]', 'multiverse_ids': [1, -20, 300], 'reserved': False, 'price': -0.0025},
+    {'id': 'c', 'name': 'Æther Vial — \U0001F600', 'card_faces': [{'a': [{}, []]}, {'b': 1e-7}], 'digest': 1e21}
+]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, utils.JSON_CHUNK_SIZE])
+@pytest.mark.parametrize('indent', [None, 2])
+def test_iter_json_array(chunk_size, indent):
+    text = json.dumps(CARDS, indent=indent, ensure_ascii=False)
+
+    items = list(utils.iter_json(io.StringIO(text), (None,), chunk_size=chunk_size))
+
+    assert [value for _, value in items] == json.loads(text)
+    assert [keys for keys, _ in items] == [(0,), (1,), (2,)]
+
+
+@pytest.mark.parametrize('text', ['[]', ' [ ] ', '[1, 2', '[{"a": 1}'])
+def test_iter_json_array_ends(text):
+    reader = utils.iter_json(io.StringIO(text), (None,), chunk_size=2)
+
+    try:
+        expected = json.loads(text)
+    except json.JSONDecodeError:
+        with pytest.raises(ValueError):
+            list(reader)
+    else:
+        assert [value for _, value in reader] == expected
+
+
+def test_iter_json_paths():
+    data = {
+        'meta': {'version': '5.2.2'},
+        'data': {
+            'ONE': {'name': 'One', 'cards': [{'uuid': '1'}, {'uuid': '2'}], 'tokens': [{'uuid': 't'}]},
+            'TWO': {'cards': [], 'name': 'Two'},
+            'THREE': {'cards': [{'uuid': '3'}]}
+        },
+        'skipped': [{'cards': [{'uuid': 'x'}]}]
+    }
+
+    items = list(utils.iter_json(io.StringIO(json.dumps(data)), ('meta',), ('data', None, 'cards', None), chunk_size=5))
+
+    assert items == [
+        (('meta',), {'version': '5.2.2'}),
+        (('data', 'ONE', 'cards', 0), {'uuid': '1'}),
+        (('data', 'ONE', 'cards', 1), {'uuid': '2'}),
+        (('data', 'THREE', 'cards', 0), {'uuid': '3'})
+    ]
+
+    # Indexes select array items, a path ending at a scalar decodes it
+    assert list(utils.iter_json(io.StringIO(json.dumps(data)), ('data', 'ONE', 'cards', 1, 'uuid'))) == [
+        (('data', 'ONE', 'cards', 1, 'uuid'), '2')
+    ]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 8, 13, 64])
+def test_iter_json_skip(chunk_size):
+    # Skipped subtrees hold brackets and escaped quotes inside strings, which must not end them early
+    prices = {
+        'uuid-1': {
+            'mtgo': {'cardhoarder': {'retail': {'normal': {'2024-01-01': -0.0025, '2024-01-02': 1e-3}}}},
+            'mtgo_note': 'a "]}" \\"[{\\\\',
+            'paper': {'tcgplayer': {'retail': {'normal': {'2024-01-01': -0.0025}}, 'currency': 'USD'}}
+        },
+        'uuid-2': {
+            'paper': {'cardmarket': {'buylist': {'foil': {'2024-01-01': 12345678.125}}}},
+            'mtgo': [['}', '\\'], {'"{': '[', 'x': [[[]]]}, '\\\\"', -0.5]
+        },
+        'uuid-3': {'mtgo': {}}
+    }
+    text = json.dumps({'data': prices, 'meta': {'date': '2024-01-02'}}, indent=1)
+
+    items = list(utils.iter_json(io.StringIO(text), ('meta',), ('data', None, 'paper'), chunk_size=chunk_size))
+
+    assert items == [
+        (('data', 'uuid-1', 'paper'), prices['uuid-1']['paper']),
+        (('data', 'uuid-2', 'paper'), prices['uuid-2']['paper']),
+        (('meta',), {'date': '2024-01-02'})
+    ]
+
+
+@pytest.mark.parametrize('text', ['-0.0025', '12345', '1e21', '-1.5E-7'])
+def test_iter_json_numbers(text):
+    # Every chunk size cuts the number somewhere, the reader must not return a prefix of it
+    for chunk_size in range(1, len(text) + 2):
+        items = list(utils.iter_json(io.StringIO(f'[{text},{text}]'), (None,), chunk_size=chunk_size))
+
+        assert [value for _, value in items] == [json.loads(text)] * 2
+
+
+def test_iter_json_skip_truncated():
+    with pytest.raises(ValueError):
+        list(utils.iter_json(io.StringIO('{"mtgo": {"a": "]}", "b": [1'), ('paper',), chunk_size=4))